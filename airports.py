@@ -0,0 +1,214 @@
+"""
+Airport index for the Southwest network.
+
+The airports are bundled in airports.json and indexed in memory on import, so a lookup by code, city, alias or
+name prefix takes microseconds. The index is used to validate searches before any browser is launched, and is
+offered to the agent as the LookupAirportTool so the LLM doesn't have to guess airport codes.
+"""
+
+import bisect
+import difflib
+import json
+import os
+import re
+import unicodedata
+from datetime import date
+
+# The bundled airport data
+AIRPORTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "airports.json")
+
+# Maximum number of passengers in a single Southwest booking
+MAX_PASSENGERS = 8
+
+def normalize_name(text):
+    """
+    Normalize a city, airport name or alias for lookups, e.g. "St. Louis" -> "st louis".
+    """
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    text = re.sub(r"[^a-z0-9 ]", "", text.lower().replace("-", " ").replace("/", " "))
+    return " ".join(text.split())
+
+class Airport():
+    """
+    An airport served by Southwest.
+    """
+    def __init__(self, code, name, city, state, country, aliases=None, city_aliases=None):
+        self.code = code
+        self.name = name
+        self.city = city
+        self.state = state
+        self.country = country
+        self.aliases = aliases or []
+        # Names of the whole city that prefer this airport, e.g. "chicago" for MDW although ORD is in Chicago too
+        self.city_aliases = city_aliases or []
+
+    def __str__(self):
+        """
+        Print the airport.
+        """
+        location = f"{self.city}, {self.state or self.country}"
+        return f"{self.code}: {self.name} ({location})"
+
+class AirportIndex():
+    """
+    In-memory index of airports by code, alias, city and name.
+    """
+    def __init__(self, airports):
+        self.by_code = {}
+        self.by_alias = {}
+        self.by_city = {}
+        self.by_name = {}
+        self.city_aliases = set()
+
+        for airport in airports:
+            self.by_code[airport.code] = airport
+            for alias in airport.aliases + airport.city_aliases:
+                alias = normalize_name(alias)
+                if alias in self.by_alias:
+                    raise ValueError(f"Alias {alias} is used by {self.by_alias[alias].code} and {airport.code}")
+                self.by_alias[alias] = airport
+            self.city_aliases.update(normalize_name(alias) for alias in airport.city_aliases)
+
+            # Airports outside the US have no state, so both names are the same
+            for city in {normalize_name(airport.city), normalize_name(f"{airport.city} {airport.state}")}:
+                self.by_city.setdefault(city, []).append(airport)
+
+            # Every name an airport is known by, for prefix and fuzzy lookups
+            for name in [airport.code, airport.name, airport.city, *airport.aliases, *airport.city_aliases]:
+                self.by_name.setdefault(normalize_name(name), []).append(airport)
+
+        self.names = sorted(self.by_name)
+
+    @classmethod
+    def load(cls, filename=AIRPORTS_FILE):
+        """
+        Load the index from the bundled airport data.
+        """
+        with open(filename) as f:
+            airports = [Airport(**airport) for airport in json.load(f)]
+        return cls(airports)
+
+    def get(self, code):
+        """
+        Get the airport with the 3-letter code, or None if Southwest doesn't serve it.
+        """
+        return self.by_code.get(code.upper()) if isinstance(code, str) else None
+
+    def resolve(self, text):
+        """
+        Resolve a code, alias or city to a single airport, or None if it is unknown or ambiguous.
+        """
+        if len(text) == 3 and self.get(text) is not None:
+            return self.get(text)
+
+        text = normalize_name(text)
+        if text in self.by_alias:
+            return self.by_alias[text]
+
+        airports = self.by_city.get(text) or self.by_name.get(text) or []
+        if len(airports) == 1:
+            return airports[0]
+        return None
+
+    def is_ambiguous(self, text):
+        """
+        Whether the text names a city with several airports, even if an alias prefers one of them (e.g. "chicago").
+        """
+        text = normalize_name(text)
+        return text in self.city_aliases or len(self.by_city.get(text, [])) > 1
+
+    def search(self, query, limit=5):
+        """
+        Search for airports by code, alias, city, name prefix or a close spelling.
+        """
+        query = normalize_name(query)
+        if not query:
+            return []
+
+        matches = []
+        def add(airports):
+            for airport in airports:
+                if airport not in matches:
+                    matches.append(airport)
+
+        # Exact matches first
+        if len(query) == 3 and self.get(query) is not None:
+            add([self.get(query)])
+        if query in self.by_alias:
+            add([self.by_alias[query]])
+        add(self.by_city.get(query, []))
+        add(self.by_name.get(query, []))
+
+        # Then names starting with the query
+        i = bisect.bisect_left(self.names, query)
+        while i < len(self.names) and self.names[i].startswith(query) and len(matches) < limit:
+            add(self.by_name[self.names[i]])
+            i += 1
+
+        # Then close spellings, e.g. "dalas"
+        if not matches:
+            for name in difflib.get_close_matches(query, self.names, n=limit, cutoff=0.8):
+                add(self.by_name[name])
+
+        return matches[:limit]
+
+# Index of the bundled airports
+airport_index = AirportIndex.load()
+
+def lookup_airports(query):
+    """
+    Look up Southwest airports for the LookupAirportTool, returning the matches as a JSON string.
+    """
+    airports = airport_index.search(query)
+    if not airports:
+        return json.dumps({"error": f"No Southwest airport found for {query!r}."})
+    return json.dumps([
+        {
+            "code": airport.code,
+            "name": airport.name,
+            "city": airport.city,
+            "state": airport.state,
+            "country": airport.country,
+        }
+        for airport in airports
+    ])
+
+def validate_event(event):
+    """
+    Validate a flight search event, raising a ValueError if it can't be searched.
+    The airport codes are normalized to uppercase in place, as Southwest's URLs expect.
+    """
+    for key in ["departure_date", "origination", "destination", "passenger_count", "adult_count"]:
+        if key not in event:
+            raise ValueError(f"Missing {key}")
+
+    try:
+        departure_date = date.fromisoformat(str(event["departure_date"]))
+    except ValueError:
+        raise ValueError(f"Invalid departure_date {event['departure_date']!r}, expected yyyy-mm-dd")
+
+    # The return date is optional, round trips only
+    if event.get("return_date"):
+        try:
+            return_date = date.fromisoformat(str(event["return_date"]))
+        except ValueError:
+            raise ValueError(f"Invalid return_date {event['return_date']!r}, expected yyyy-mm-dd")
+        if return_date < departure_date:
+            raise ValueError("The return_date is before the departure_date")
+
+    for key in ["origination", "destination"]:
+        if airport_index.get(event[key]) is None:
+            raise ValueError(f"Unknown {key} airport code {event[key]!r}")
+        event[key] = event[key].upper()
+    if event["origination"] == event["destination"]:
+        raise ValueError("The origination and destination airports are the same")
+
+    try:
+        passenger_count = int(event["passenger_count"])
+        adult_count = int(event["adult_count"])
+    except (TypeError, ValueError):
+        raise ValueError("passenger_count and adult_count must be integers")
+    if not 1 <= passenger_count <= MAX_PASSENGERS:
+        raise ValueError(f"passenger_count must be between 1 and {MAX_PASSENGERS}")
+    if not 1 <= adult_count <= passenger_count:
+        raise ValueError("adult_count must be between 1 and passenger_count")
@@ -1,8 +1,13 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from scrape import main, FlightsEncoder
+from scrape import initialize_parse_executor
+from airports import validate_event
+from jobs import initialize_broker, start_worker_threads, scrape_flights, QueueFull, PRIORITIES
+from functools import partial
+import asyncio
 import logging
 import json
+import threading
 
 # Set DEBUG Flag
 DEBUG = False
@@ -14,6 +19,27 @@ CORS(app)
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
 
+# Queue of scrape jobs, run by the workers rather than the request handlers
+broker = initialize_broker()
+
+# Whether this process started its workers
+workers_started = False
+workers_lock = threading.Lock()
+
+def initialize_workers():
+    """
+    Start the HTML parse workers and the embedded scrape workers of this process, once.
+    Called on the first request, so they also start when the app is served by flask run or gunicorn (after forking).
+    Set QUEUE_WORKERS=0 when separate worker processes run the jobs (see jobs.py).
+    """
+    global workers_started
+    with workers_lock:
+        if workers_started:
+            return
+        initialize_parse_executor()
+        start_worker_threads(broker, scrape=partial(scrape_flights, debug=DEBUG))
+        workers_started = True
+
 @app.route('/', methods=['POST'])
 async def index():
     """
@@ -28,15 +54,60 @@ async def index():
     data = request.get_json()
     app.logger.info(f'POST Data: {json.dumps(data)}')
 
-    # Search for the Flights
-    app.logger.info(f'Searching for flights...')
-    flights = await main(data, debug=DEBUG)
-    app.logger.info(f'Flights:\n\n{flights}')
+    # Interactive searches run before prefetch searches
+    priority = data.pop('priority', 'interactive')
+    if priority not in PRIORITIES:
+        return jsonify(
+            message=f'Invalid search: unknown priority {priority!r}, expected one of {", ".join(PRIORITIES)}',
+            status=400
+        ), 400
+
+    try:
+        validate_event(data)
+    except ValueError as e:
+        app.logger.info(f'Invalid search: {e}')
+        return jsonify(
+            message=f'Invalid search: {e}',
+            status=400
+        ), 400
+
+    # Queue the search, asking the client to back off if the queue is saturated
+    initialize_workers()
+    try:
+        job_id = broker.submit(data, PRIORITIES[priority])
+    except QueueFull as e:
+        app.logger.warning(f'Queue full, retry after {e.retry_after}s')
+        response = jsonify(
+            message=str(e),
+            status=429
+        )
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+
+    # Wait for a worker to search for the Flights
+    app.logger.info(f'Searching for flights (job {job_id})...')
+    try:
+        job = await asyncio.to_thread(broker.wait, job_id)
+    except TimeoutError as e:
+        app.logger.warning(str(e))
+        return jsonify(
+            message=str(e),
+            status=504
+        ), 504
+    if job.status == 'failed':
+        app.logger.error(f'Job {job_id} failed: {job.error}')
+        return jsonify(
+            message=f'Search failed: {job.error}',
+            status=500
+        ), 500
+    app.logger.info(f'Flights:\n\n{job.result}')
 
     return jsonify(
-        message=json.dumps(flights, cls=FlightsEncoder),
+        message=job.result,
         status=200
     )
 
 if __name__ == "__main__":
+    # Start the workers before serving requests
+    initialize_workers()
     app.run(debug=DEBUG, host='0.0.0.0', port=80)
@@ -0,0 +1,361 @@
+"""
+Benchmarks for the Southwest Generative AI Agent.
+
+Runs offline: the LLM is faked and the scraper replays the saved debug.html page, each with a configurable latency
+standing in for the real LLM round trip and browser session.
+
+Usage:
+    python benchmark.py parallel --dates 5
+    python benchmark.py fastpath
+    python benchmark.py parse --searches 8
+    python benchmark.py queue --jobs 24
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from functools import partial
+from datetime import date, timedelta
+from intent import CONFIDENCE_THRESHOLD, parse_flight_search
+from jobs import SQLiteBroker, start_worker_processes
+from langchain.agents import AgentExecutor, Tool, create_structured_chat_agent
+from langchain_community.chat_models.fake import FakeListChatModel
+from langchain_core.prompts.chat import ChatPromptTemplate
+from multi_action import ParallelAgentExecutor, create_multi_action_structured_chat_agent
+from scrape import main, initialize_parse_executor, parse_html, parse_html_async, Flights, FlightsEncoder
+
+class SlowFakeChatModel(FakeListChatModel):
+    """
+    Fake chat model that returns canned responses after a fixed latency.
+    """
+    latency: float = 1.0
+    calls: int = 0
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        return super()._call(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+def initialize_replay_tool(scrape_latency, calls):
+    """
+    Initialize a SearchSouthwestFlightsTool that replays debug.html instead of scraping Southwest.
+    """
+    def replay_search(event):
+        calls.append(event)
+        time.sleep(scrape_latency)
+        flights = asyncio.run(main(json.loads(event), debug=True))
+        return json.dumps(flights, cls=FlightsEncoder)
+
+    return Tool(
+        name="SearchSouthwestFlightsTool",
+        func=replay_search,
+        description="Search Southwest Airlines for flights. The input is a JSON encoded string.",
+    )
+
+def initialize_prompt():
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", "You have access to the following tools:\n\n{tools}\n\nValid actions: {tool_names}"),
+            ("human", "{input}\n\n{agent_scratchpad}"),
+        ]
+    )
+    return prompt
+
+def json_blob(actions):
+    """
+    Format actions as the LLM would, in a markdown JSON blob.
+    """
+    return f"Action:\n```\n{json.dumps(actions)}\n```"
+
+def benchmark_parallel(args):
+    """
+    Compare a multi-date search with the single-action agent against the multi-action agent.
+    """
+    start_date = date(2024, 4, 22)
+    events = [
+        json.dumps({
+            "departure_date": (start_date + timedelta(days=i)).isoformat(),
+            "origination": "SAN",
+            "destination": "DAL",
+            "passenger_count": 1,
+            "adult_count": 1
+        })
+        for i in range(args.dates)
+    ]
+    actions = [{"action": "SearchSouthwestFlightsTool", "action_input": event} for event in events]
+    final_answer = {"action": "Final Answer", "action_input": "Here are the cheapest flights for each date."}
+    user_input = f"Compare flights from San Diego to Dallas over the {args.dates} days from April 22nd, 2024."
+
+    # The single-action agent needs one LLM call per search plus one for the answer
+    serial_responses = [json_blob(action) for action in actions] + [json_blob(final_answer)]
+    # The multi-action agent plans every search in one LLM call
+    parallel_responses = [json_blob(actions), json_blob(final_answer)]
+
+    # Start the parse executor and warm it up, so its startup isn't timed as part of the first agent
+    initialize_parse_executor()
+    asyncio.run(main(json.loads(events[0]), debug=True))
+
+    results = []
+    for name, create_agent, executor_class, responses in [
+        ("single-action", create_structured_chat_agent, AgentExecutor, serial_responses),
+        ("multi-action", create_multi_action_structured_chat_agent, ParallelAgentExecutor, parallel_responses),
+    ]:
+        calls = []
+        tools = [initialize_replay_tool(args.scrape_latency, calls)]
+        model = SlowFakeChatModel(responses=responses, latency=args.llm_latency)
+        agent = create_agent(model, tools, initialize_prompt())
+        executor_kwargs = {"max_concurrency": args.max_concurrency} if executor_class is ParallelAgentExecutor else {}
+        agent_executor = executor_class(
+            agent=agent,
+            tools=tools,
+            stream_runnable=False,
+            return_intermediate_steps=True,
+            **executor_kwargs
+        )
+
+        start = time.perf_counter()
+        response = agent_executor.invoke({"input": user_input})
+        elapsed = time.perf_counter() - start
+
+        assert len(calls) == args.dates, f"{name} ran {len(calls)} searches, expected {args.dates}"
+        results.append((name, model.calls, len(response["intermediate_steps"]), elapsed))
+
+    print(f"\n{args.dates}-date comparison (LLM latency {args.llm_latency}s, scrape latency {args.scrape_latency}s)")
+    print(f"{'Agent':<15}{'LLM calls':>10}{'Searches':>10}{'Time (s)':>10}")
+    for name, llm_calls, searches, elapsed in results:
+        print(f"{name:<15}{llm_calls:>10}{searches:>10}{elapsed:>10.2f}")
+    print(f"Speedup: {results[0][3] / results[1][3]:.1f}x")
+
+def search_event(departure_date, origination, destination, passenger_count=1):
+    return {
+        "departure_date": departure_date,
+        "origination": origination,
+        "destination": destination,
+        "passenger_count": passenger_count,
+        "adult_count": passenger_count,
+    }
+
+# Sample utterances and the search the fast path should make, or None if it should fall back to the LLM.
+# Relative dates are resolved against FAST_PATH_TODAY, a Friday.
+FAST_PATH_TODAY = date(2024, 4, 19)
+FAST_PATH_CORPUS = [
+    ("Hello can you please find me flights from San Diego to Dallas on April 22nd, 2024 for 1 adult passenger?", search_event("2024-04-22", "SAN", "DAL")),
+    ("flights SAN to DAL on 2024-04-22 for 1 adult", search_event("2024-04-22", "SAN", "DAL")),
+    ("Find flights from LAX to PHX on 5/3 for 2 adults", search_event("2024-05-03", "LAX", "PHX", 2)),
+    ("Any flights from Oakland to Las Vegas tomorrow for one adult?", search_event("2024-04-20", "OAK", "LAS")),
+    ("I need flights from Denver to Chicago Midway next Friday for 3 passengers", search_event("2024-04-26", "DEN", "MDW", 3)),
+    ("Show me flights from Houston Hobby to New Orleans in 10 days for two people", search_event("2024-04-29", "HOU", "MSY", 2)),
+    ("flights from sfo to sea on June 1 for 1 adult", search_event("2024-06-01", "SFO", "SEA")),
+    ("Flights from Austin to Nashville on 12/20/2024, 4 adults", search_event("2024-12-20", "AUS", "BNA", 4)),
+    ("Could you look up flights from Baltimore to Orlando on the 3rd of May for 2 travelers", search_event("2024-05-03", "BWI", "MCO", 2)),
+    ("find flights from Phoenix to SJC this Sunday for 1 passenger", search_event("2024-04-21", "PHX", "SJC")),
+    ("One-way flights from Nashville to Fort Lauderdale on May 2 for 2 adults please", search_event("2024-05-02", "BNA", "FLL", 2)),
+    ("Flights from Salt Lake City to Burbank today for 1 adult", search_event("2024-04-19", "SLC", "BUR")),
+    ("flights from Tampa to Boston on Jan 15 for 1 adult", search_event("2025-01-15", "TPA", "BOS")),
+    ("flights from kansas city to st. louis on 2024-05-10 for 2 adults", search_event("2024-05-10", "MCI", "STL", 2)),
+    ("Find flights from San Diego to Dallas on April 22nd", None),
+    ("Compare flights from SAN to DAL on April 22nd and April 23rd for 1 adult", None),
+    ("Flights from San Diego to Dallas or Houston on April 22nd for 1 adult", None),
+    ("Find round trip flights from LAX to DEN on May 1 returning May 5 for 1 adult", None),
+    ("Flights from San Diego to Dallas on April 22nd for 2 adults and 1 child", None),
+    ("What is the cheapest day to fly from San Diego to Dallas next week?", None),
+    ("Can you book me on flight 1234 from SAN to DAL on April 22nd for 1 adult?", None),
+    ("Flights from Gotham to Metropolis on April 22nd for 1 adult", None),
+    ("Flights from San Diego to San Diego on April 22nd for 1 adult", None),
+    ("Flights from San Diego to Dallas on April 1st, 2024 for 1 adult", None),
+    ("What is your baggage policy?", None),
+    # Requests with more than the slots the fast path can search for
+    ("Find flights from San Diego to Dallas on April 22nd and 23rd for 1 adult", None),
+    ("Flights from San Diego to Dallas on April 22nd for 1 adult, nonstop only", None),
+    ("Any flights from San Diego to Dallas on April 22nd for 1 adult, anything before noon?", None),
+    ("Flights from San Diego to Dallas on April 22nd for 1 adult under $200", None),
+    ("Flights from San Diego to Dallas tomorrow evening for 1 adult", None),
+    ("Flights from San Diego to Dallas on April 22nd for 1 adult in first class", None),
+    ("No flights from San Diego to Dallas tomorrow for 1 adult, I want Houston", None),
+    # Cities with several airports
+    ("Flights from New York City to Portland on April 22nd for 1 adult", None),
+    ("I need flights from Denver to Chicago next Friday for 3 passengers", None),
+    ("Show me flights from Houston to New Orleans in 10 days for two people", None),
+    ("find flights from Phoenix to San Jose this Sunday for 1 passenger", None),
+    ("Flights from Washington to Boston on May 1 for 1 adult", None),
+    ("flights from SAN to DAL in 99999999 days for 1 adult", None),
+    ("Thanks, that's all!", None),
+]
+
+def benchmark_fastpath(args):
+    """
+    Measure the fast path hit rate, accuracy and the LLM latency it saves on a corpus of sample utterances.
+    """
+    hits = 0
+    wrong = 0
+    parse_time = 0.0
+    for user_input, expected_event in FAST_PATH_CORPUS:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            event, confidence = parse_flight_search(user_input, today=FAST_PATH_TODAY)
+        parse_time += (time.perf_counter() - start) / args.repeat
+
+        if event is not None and confidence >= CONFIDENCE_THRESHOLD:
+            hits += 1
+            if event != expected_event:
+                wrong += 1
+                print(f"WRONG: {user_input!r}\n  got      {event}\n  expected {expected_event}")
+        elif expected_event is not None:
+            print(f"MISSED: {user_input!r} (confidence {confidence:.2f})")
+
+    simple = sum(1 for _, expected_event in FAST_PATH_CORPUS if expected_event is not None)
+    # Every hit skips the LLM call that plans the search and the one that writes the answer
+    saved = hits * 2 * args.llm_latency - parse_time
+
+    print(f"\nFast path on {len(FAST_PATH_CORPUS)} utterances ({simple} simple searches)")
+    print(f"Hit rate: {hits / len(FAST_PATH_CORPUS):.0%} of all, {hits / simple:.0%} of simple searches ({wrong} wrong)")
+    print(f"Average parse time: {parse_time / len(FAST_PATH_CORPUS) * 1e6:.0f}us")
+    print(f"LLM latency saved: {saved:.1f}s ({args.llm_latency}s per LLM call)")
+    if wrong:
+        raise SystemExit(f"{wrong} wrong fast path searches")
+
+async def measure_event_loop_lag(stop, lags, interval=0.01):
+    """
+    Record how late the event loop wakes up a task that sleeps for the interval, until stop is set.
+    """
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+async def replay_searches(html, searches, scrape_latency):
+    """
+    Run simultaneous searches that wait for a fake browser session, then parse the replayed HTML.
+    """
+    async def replay_search():
+        await asyncio.sleep(scrape_latency)
+        flights = Flights("2024-04-22", "SAN", "DAL", 1, 1)
+        await parse_html_async(flights, html)
+        return flights
+
+    stop = asyncio.Event()
+    lags = []
+    lag_task = asyncio.create_task(measure_event_loop_lag(stop, lags))
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[replay_search() for _ in range(searches)])
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await lag_task
+    assert all(flights.flights for flights in results)
+    return elapsed, lags
+
+def benchmark_parse(args):
+    """
+    Measure the event loop lag and throughput of simultaneous searches for each parse executor.
+    """
+    with open("debug.html") as f:
+        html = f.read()
+
+    print(f"\n{args.searches} simultaneous searches (scrape latency {args.scrape_latency}s, {args.workers or 'one per core'} workers)")
+    print(f"{'Executor':<10}{'Time (s)':>10}{'Searches/s':>12}{'Max lag (ms)':>14}{'Mean lag (ms)':>15}")
+    for kind in ["inline", "thread", "process"]:
+        if args.workers:
+            initialize_parse_executor(kind, args.workers)
+        else:
+            initialize_parse_executor(kind)
+
+        # Warm up the pool so worker startup isn't measured
+        asyncio.run(replay_searches(html, 1, 0))
+        elapsed, lags = asyncio.run(replay_searches(html, args.searches, args.scrape_latency))
+
+        print(
+            f"{kind:<10}{elapsed:>10.2f}{args.searches / elapsed:>12.1f}"
+            f"{max(lags) * 1000:>14.0f}{sum(lags) / len(lags) * 1000:>15.1f}"
+        )
+
+    initialize_parse_executor("inline")
+
+async def replay_scrape(event, browser_pool, scrape_latency=0.0):
+    """
+    Scrape job that waits for a fake browser session, then parses the replayed HTML.
+    """
+    await asyncio.sleep(scrape_latency)
+    with open("debug.html") as f:
+        html = f.read()
+    flights = Flights(event["departure_date"], event["origination"], event["destination"], 1, 1)
+    parse_html(flights, html)
+    return flights
+
+def run_jobs(broker, jobs):
+    """
+    Submit jobs and wait for all of them to finish, returning the elapsed time.
+    """
+    start = time.perf_counter()
+    job_ids = [
+        broker.submit(search_event((date(2024, 4, 22) + timedelta(days=i % 30)).isoformat(), "SAN", "DAL"))
+        for i in range(jobs)
+    ]
+    results = [broker.wait(job_id) for job_id in job_ids]
+    elapsed = time.perf_counter() - start
+    assert all(job.status == "done" and json.loads(job.result)["flights"] for job in results)
+    return elapsed
+
+def benchmark_queue(args):
+    """
+    Measure the throughput of the sqlite job queue as worker processes are added.
+    """
+    print(f"\n{args.jobs} queued searches (scrape latency {args.scrape_latency}s, {args.browsers} browser(s) per worker)")
+    print(f"{'Workers':<10}{'Time (s)':>10}{'Searches/s':>12}{'Speedup':>10}")
+    baseline = None
+    scrape = partial(replay_scrape, scrape_latency=args.scrape_latency)
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "jobs.db")
+            broker = SQLiteBroker(path, max_queued=args.jobs)
+            stop = multiprocessing.get_context("spawn").Event()
+            processes = start_worker_processes(path, workers, args.browsers, scrape, stop)
+            try:
+                # Warm up the workers so process startup isn't measured
+                run_jobs(broker, workers * args.browsers)
+                elapsed = run_jobs(broker, args.jobs)
+            finally:
+                stop.set()
+                for process in processes:
+                    process.join()
+
+        baseline = baseline or elapsed
+        print(f"{workers:<10}{elapsed:>10.2f}{args.jobs / elapsed:>12.1f}{baseline / elapsed:>9.1f}x")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    parallel_parser = subparsers.add_parser("parallel", help="Single-action vs multi-action agent on a multi-date comparison.")
+    parallel_parser.add_argument("--dates", type=int, default=5)
+    parallel_parser.add_argument("--llm-latency", type=float, default=1.0)
+    parallel_parser.add_argument("--scrape-latency", type=float, default=2.0)
+    parallel_parser.add_argument("--max-concurrency", type=int, default=4)
+    parallel_parser.set_defaults(func=benchmark_parallel)
+
+    fastpath_parser = subparsers.add_parser("fastpath", help="Fast path hit rate and latency saved on sample utterances.")
+    fastpath_parser.add_argument("--llm-latency", type=float, default=1.0)
+    fastpath_parser.add_argument("--repeat", type=int, default=100)
+    fastpath_parser.set_defaults(func=benchmark_fastpath)
+
+    parse_parser = subparsers.add_parser("parse", help="Event loop lag and throughput of simultaneous searches per parse executor.")
+    parse_parser.add_argument("--searches", type=int, default=8)
+    parse_parser.add_argument("--scrape-latency", type=float, default=0.5)
+    parse_parser.add_argument("--workers", type=int, default=None)
+    parse_parser.set_defaults(func=benchmark_parse)
+
+    queue_parser = subparsers.add_parser("queue", help="Throughput of the job queue as worker processes are added.")
+    queue_parser.add_argument("--jobs", type=int, default=24)
+    queue_parser.add_argument("--scrape-latency", type=float, default=1.0)
+    queue_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    queue_parser.add_argument("--browsers", type=int, default=1)
+    queue_parser.set_defaults(func=benchmark_queue)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,292 @@
+"""
+Cache for repeated agent questions.
+
+Many users ask nearly identical questions (e.g. "flights SAN to DAL on 2024-04-22 for 1 adult"), and each one
+runs the full ReAct loop in the AgentExecutor. This module caches two things keyed on the normalized prompt plus
+the most recent chat history:
+
+1. Tool plans: the action(s) the agent chose in its first step. On a hit the agent skips the first LLM call and goes
+   straight to the tool calls.
+2. Final answers: the whole response. These are only served while the underlying flight data is still fresh.
+
+Both caches use a TTL and LRU eviction. Hit rates and the LLM latency saved are tracked in `AgentCache.stats`.
+Turns where a tool returned an error (an invalid search, a full queue, a failed scrape) are never cached.
+"""
+
+import contextvars
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from langchain_core.agents import AgentAction
+from langchain_core.runnables import RunnableLambda
+
+# How long a tool plan is reused for (seconds)
+PLAN_TTL = 60 * 60
+
+# How long a final answer is reused for (seconds). Prices and seats left change quickly, so keep this short.
+ANSWER_TTL = 5 * 60
+
+# Maximum number of entries per cache before the least recently used one is evicted
+MAX_ENTRIES = 1024
+
+# Number of previous chat messages that are part of the cache key
+HISTORY_MESSAGES = 2
+
+# Name of the tool the AgentExecutor calls when the LLM output can't be parsed
+PARSE_ERROR_TOOL = "_Exception"
+
+logger = logging.getLogger(__name__)
+
+def is_error_observation(observation):
+    """
+    Whether a tool observation is an error.
+
+    The tools return JSON on success, so anything else (e.g. "Invalid search: ..." or a queue full message from the
+    API) is an error, as is a JSON object with an "error" key.
+    """
+    try:
+        result = json.loads(observation)
+    except (TypeError, ValueError):
+        return True
+    return isinstance(result, dict) and "error" in result
+
+def normalize_text(text):
+    """
+    Normalize text so that trivially different prompts share a cache key.
+    """
+    text = text.lower()
+    text = re.sub(r"[^\w\s:/-]", " ", text)
+    return " ".join(text.split())
+
+def make_key(user_input, chat_history=None, history_messages=HISTORY_MESSAGES):
+    """
+    Make the cache key for a prompt and its chat history.
+
+    Today's date is part of the key so relative dates ("tomorrow") are never resolved against a stale day.
+    """
+    parts = [date.today().isoformat()]
+    if chat_history and history_messages:
+        for message in chat_history[-history_messages:]:
+            parts.append(normalize_text(str(message.content)))
+    parts.append(normalize_text(user_input))
+    return "\n".join(parts)
+
+class LRUCache():
+    """
+    A thread safe LRU cache where every entry expires after a TTL.
+    """
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=PLAN_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get the value for the key, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """
+        Store the value for the key, evicting the least recently used entries if full.
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class AgentCache():
+    """
+    Tool plan and final answer cache for an AgentExecutor.
+    """
+    def __init__(
+        self,
+        plan_ttl=PLAN_TTL,
+        answer_ttl=ANSWER_TTL,
+        max_entries=MAX_ENTRIES,
+        history_messages=HISTORY_MESSAGES
+    ):
+        self.plans = LRUCache(max_entries, plan_ttl)
+        self.answers = LRUCache(max_entries, answer_ttl)
+        self.history_messages = history_messages
+        self.stats = {
+            "lookups": 0,
+            "answer_hits": 0,
+            "plan_hits": 0,
+            "misses": 0,
+            "saved_latency": 0.0,
+        }
+        # LLM latency of the turn that is running in the current thread or task
+        self._turn = contextvars.ContextVar(f"agent_cache_turn_{id(self)}", default=None)
+        self._lock = threading.Lock()
+
+    def key(self, user_input, chat_history=None):
+        """
+        Make the cache key for a prompt and its chat history.
+        """
+        return make_key(user_input, chat_history, self.history_messages)
+
+    def wrap_agent(self, agent):
+        """
+        Wrap an agent runnable so the first step of a turn reuses a cached tool plan instead of calling the LLM.
+        """
+        def plan(inputs, config):
+            key = self.key(inputs["input"], inputs.get("chat_history"))
+
+            # Outside of invoke there is no turn to record the latency for
+            turn = self._turn.get()
+            if turn is None:
+                turn = {"first_step_latency": None, "llm_latency": 0.0}
+
+            # Only the first step of a turn can be planned from the cache
+            first_step = not inputs["intermediate_steps"]
+            cached_plan = self.plans.get(key) if first_step else None
+            if cached_plan is not None:
+                plan_actions, latency = cached_plan
+                self._record_hit("plan_hits", latency)
+                with self._lock:
+                    turn["llm_latency"] += latency
+                log = f"Reusing cached tool plan for {', '.join(tool for tool, _ in plan_actions)}."
+                actions = [
+                    AgentAction(tool, tool_input, log if i == 0 else "")
+                    for i, (tool, tool_input) in enumerate(plan_actions)
+                ]
+                return actions[0] if len(actions) == 1 else actions
+
+            start = time.perf_counter()
+            output = agent.invoke(inputs, config)
+            latency = time.perf_counter() - start
+            with self._lock:
+                turn["llm_latency"] += latency
+                if first_step:
+                    turn["first_step_latency"] = latency
+            return output
+
+        return RunnableLambda(plan)
+
+    def invoke(self, agent_executor, user_input, chat_history=None, config=None):
+        """
+        Answer the prompt from the cache if possible, otherwise run the agent executor and cache its response.
+        """
+        key = self.key(user_input, chat_history)
+
+        cached_answer = self.answers.get(key)
+        if cached_answer is not None:
+            response, latency = cached_answer
+            self._record_hit("answer_hits", latency)
+            # Keep the conversation history consistent with a normal turn
+            if agent_executor.memory is not None:
+                agent_executor.memory.save_context({"input": user_input}, {"output": response["output"]})
+            return dict(response, input=user_input, chat_history=chat_history, cached=True)
+
+        turn = {"first_step_latency": None, "llm_latency": 0.0}
+        token = self._turn.set(turn)
+        try:
+            response = agent_executor.invoke(
+                input={
+                    "input": f"{user_input}",
+                    "chat_history": chat_history,
+                },
+                config=config
+            )
+        finally:
+            self._turn.reset(token)
+
+        self.store(key, response, turn["first_step_latency"], turn["llm_latency"])
+        return response
+
+    def store(self, key, response, first_step_latency, llm_latency):
+        """
+        Cache the tool plan and final answer of a finished turn.
+        """
+        # A None latency means the plan itself came from the cache, so the turn is a plan hit and not a miss
+        if first_step_latency is not None:
+            self._record_miss()
+
+        # Never cache a turn built on an error, it would be replayed to everyone asking the same question
+        steps = response.get("intermediate_steps") or []
+        if any(action.tool != PARSE_ERROR_TOOL and is_error_observation(observation) for action, observation in steps):
+            logger.info("Not caching a turn with a tool error.")
+            return
+
+        if steps and first_step_latency is not None:
+            # Actions planned by the same LLM call (a multi-action step) follow the first one with an empty log
+            plan_actions = [(steps[0][0].tool, steps[0][0].tool_input)]
+            for action, _ in steps[1:]:
+                if action.log:
+                    break
+                plan_actions.append((action.tool, action.tool_input))
+            # Never cache a plan that came from an output parsing error
+            if all(tool != PARSE_ERROR_TOOL for tool, _ in plan_actions):
+                self.plans.put(key, (plan_actions, first_step_latency))
+
+        # An answer hit saves the LLM latency of the turn, the tool calls were part of the cached answer
+        self.answers.put(key, ({"output": response["output"], "intermediate_steps": steps}, llm_latency))
+
+    def hit_rate(self):
+        """
+        Compute the fraction of lookups that were answered or planned from the cache.
+        """
+        if self.stats["lookups"] == 0:
+            return 0.0
+        return (self.stats["answer_hits"] + self.stats["plan_hits"]) / self.stats["lookups"]
+
+    def report(self):
+        """
+        Summarize the cache hit rates and LLM latency saved.
+        """
+        return (
+            f"Cache hit rate: {self.hit_rate():.0%} "
+            f"({self.stats['answer_hits']} answers, {self.stats['plan_hits']} plans, {self.stats['misses']} misses), "
+            f"LLM latency saved: {self.stats['saved_latency']:.1f}s"
+        )
+
+    def _record_hit(self, kind, latency):
+        with self._lock:
+            self.stats["lookups"] += 1
+            self.stats[kind] += 1
+            self.stats["saved_latency"] += latency
+        logger.info(f"Cache {kind[:-1].replace('_', ' ')}, saved {latency:.2f}s. {self.report()}")
+
+    def _record_miss(self):
+        with self._lock:
+            self.stats["lookups"] += 1
+            self.stats["misses"] += 1
+        logger.info(f"Cache miss. {self.report()}")
+
+# Cache shared by every session of the Streamlit app. Modules are only imported once, so this survives reruns.
+_shared_cache = None
+
+def get_shared_cache():
+    """
+    Get the cache shared by every session of the app.
+    """
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = AgentCache()
+    return _shared_cache
@@ -0,0 +1,316 @@
+"""
+Deterministic fast path for simple flight searches.
+
+Most questions are plain "find flights from X to Y on DATE for N adults" requests, and for each one the agent makes an
+LLM call just to build the JSON for the SearchSouthwestFlightsTool, then another to summarize the result. This module
+extracts the origin, destination, date and passenger count with rules, calls the tool directly when it is confident,
+and formats the answer itself. The fast path is only taken when every word of the request is one of those slots or a
+filler word, so a request with anything more (a second date, "nonstop", "under $200", "evening") or an ambiguous city
+returns None and the caller falls back to the LLM agent.
+"""
+
+import calendar
+import json
+import logging
+import re
+from datetime import date, timedelta
+from langchain_core.agents import AgentAction
+from airports import airport_index
+
+# Minimum confidence needed to skip the LLM
+CONFIDENCE_THRESHOLD = 0.9
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9,
+}
+
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+MONTHS["sept"] = 9
+
+WEEKDAYS = {name.lower(): number for number, name in enumerate(calendar.day_name)}
+
+# Words that mean the request is more than a single one-way search
+AMBIGUOUS_WORDS = re.compile(
+    r"\b(or|compare|comparing|cheapest day|round ?trip|return(?:ing)?|back on|book|cancel|change|"
+    r"child|children|kids?|infants?|seniors?)\b"
+)
+
+AIRPORT_PATTERN = re.compile(
+    r"\bfrom\s+(?P<origination>.+?)\s+to\s+(?P<destination>.+?)"
+    r"(?=\s+(?:on|for|this|next|tomorrow|today|in|leaving|departing)\b|[,.?!]|$)"
+)
+
+BARE_AIRPORT_PATTERN = re.compile(
+    r"\b(?P<origination>[a-z][a-z .]*?)\s+(?:to|->)\s+(?P<destination>[a-z][a-z .]*?)"
+    r"(?=\s+(?:on|for|this|next|tomorrow|today|in|leaving|departing)\b|[,.?!]|$)"
+)
+
+# Words that may appear around the slots without changing the search
+FILLER_WORDS = {
+    "a", "an", "any", "are", "available", "can", "check", "could", "departing", "do", "find", "flight", "flights",
+    "fly", "flying", "for", "from", "get", "give", "have", "hello", "hey", "hi", "i", "i'd", "i'm", "is", "leaving",
+    "like", "list", "look", "looking", "me", "need", "on", "please", "search", "show", "some", "the", "there", "ticket",
+    "tickets", "to", "up", "us", "want", "we", "what", "would", "you",
+}
+
+PASSENGER_PATTERN = re.compile(
+    r"\b(?P<count>\d+|" + "|".join(NUMBER_WORDS) + r")\s+(?:adult\s+)?(?:adults?|passengers?|people|persons?|travell?ers?|tickets?)\b"
+)
+
+logger = logging.getLogger(__name__)
+
+def resolve_airport(text):
+    """
+    Resolve an airport code, city or alias to an airport code, or None if it is unknown or ambiguous.
+    """
+    text = re.sub(r"\b(the|airport|international|intl|area|city of)\b", "", text.lower()).strip()
+    # e.g. "chicago" could be MDW or ORD, so let the LLM ask
+    if airport_index.is_ambiguous(text):
+        return None
+    airport = airport_index.resolve(text)
+    if airport is None:
+        return None
+    return airport.code
+
+def parse_airports(text):
+    """
+    Parse the origination and destination airport codes, and the span of the text they were parsed from.
+    """
+    match = AIRPORT_PATTERN.search(text) or BARE_AIRPORT_PATTERN.search(text)
+    if match is None:
+        return None, None, None
+
+    # The bare pattern may swallow leading words ("find flights san diego"), so use the longest suffix that resolves
+    origination = None
+    start = match.start("origination")
+    words = match.group("origination").split(" ")
+    for i in range(len(words)):
+        origination = resolve_airport(" ".join(words[i:]))
+        if origination is not None:
+            start += sum(len(word) + 1 for word in words[:i])
+            break
+
+    destination = resolve_airport(match.group("destination"))
+    return origination, destination, (start, match.end("destination"))
+
+def next_date(today, month, day):
+    """
+    The next date on or after today with the month and day.
+    """
+    candidate = date(today.year, month, day)
+    if candidate < today:
+        candidate = date(today.year + 1, month, day)
+    return candidate
+
+def parse_date(text, today):
+    """
+    Parse the departure date, resolving relative dates against today.
+
+    Returns the date and the span of the text it was parsed from, or (None, None).
+    """
+    # 2024-04-22
+    match = re.search(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b", text)
+    if match:
+        return date(int(match.group(1)), int(match.group(2)), int(match.group(3))), match.span()
+
+    # 4/22/2024, 4/22/24 or 4/22
+    match = re.search(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2}|\d{4}))?\b", text)
+    if match:
+        month, day = int(match.group(1)), int(match.group(2))
+        if match.group(3) is None:
+            return next_date(today, month, day), match.span()
+        year = int(match.group(3))
+        return date(year + 2000 if year < 100 else year, month, day), match.span()
+
+    # April 22nd, 2024 or April 22
+    month_names = "|".join(sorted(MONTHS, key=len, reverse=True))
+    match = re.search(rf"\b({month_names})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?(?:,?\s+(\d{{4}}))?\b", text)
+    if match:
+        month, day = MONTHS[match.group(1)], int(match.group(2))
+        if match.group(3) is None:
+            return next_date(today, month, day), match.span()
+        return date(int(match.group(3)), month, day), match.span()
+
+    # 22nd of April 2024 or 22 April
+    match = re.search(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?({month_names})\b(?:,?\s+(\d{{4}}))?", text)
+    if match:
+        day, month = int(match.group(1)), MONTHS[match.group(2)]
+        if match.group(3) is None:
+            return next_date(today, month, day), match.span()
+        return date(int(match.group(3)), month, day), match.span()
+
+    match = re.search(r"\btoday\b", text)
+    if match:
+        return today, match.span()
+    match = re.search(r"\bday after tomorrow\b", text)
+    if match:
+        return today + timedelta(days=2), match.span()
+    match = re.search(r"\btomorrow\b", text)
+    if match:
+        return today + timedelta(days=1), match.span()
+
+    match = re.search(r"\bin\s+(\d+|" + "|".join(NUMBER_WORDS) + r")\s+days?\b", text)
+    if match:
+        return today + timedelta(days=parse_number(match.group(1))), match.span()
+
+    # next friday, this friday or on friday
+    match = re.search(r"\b(next|this|on)\s+(" + "|".join(WEEKDAYS) + r")\b", text)
+    if match:
+        days_ahead = (WEEKDAYS[match.group(2)] - today.weekday()) % 7
+        if match.group(1) == "next" and days_ahead == 0:
+            days_ahead = 7
+        return today + timedelta(days=days_ahead), match.span()
+
+    return None, None
+
+def parse_number(text):
+    """
+    Parse a number written in digits or words.
+    """
+    if text.isdigit():
+        return int(text)
+    return NUMBER_WORDS[text]
+
+def unparsed_words(text, spans):
+    """
+    The words of the text outside the parsed spans that aren't filler words.
+    """
+    for start, end in spans:
+        text = text[:start] + " " * (end - start) + text[end:]
+    text = re.sub(r"\bone[- ]way\b", " ", text)
+    return [word for word in re.findall(r"[\w$'-]+", text) if word not in FILLER_WORDS]
+
+def parse_flight_search(user_input, today=None):
+    """
+    Parse a simple one-way flight search.
+
+    Returns the tool event and a confidence between 0 and 1, or (None, 0.0) if the request is not a simple search.
+    """
+    today = today or date.today()
+    text = " ".join(user_input.lower().split())
+    # "St. Louis" and "Ft. Myers", so the period doesn't end the airport name
+    text = re.sub(r"\bst\.", "st", text)
+    text = re.sub(r"\bft\.? ", "fort ", text)
+
+    if not re.search(r"\bflights?\b", text) or AMBIGUOUS_WORDS.search(text):
+        return None, 0.0
+
+    origination, destination, airport_span = parse_airports(text)
+    if origination is None or destination is None or origination == destination:
+        return None, 0.0
+
+    try:
+        departure_date, date_span = parse_date(text, today)
+    except (ValueError, OverflowError):
+        # e.g. February 30th, or "in 99999999 days" which is past the last representable date
+        return None, 0.0
+    if departure_date is None or departure_date < today:
+        return None, 0.0
+
+    # Assume one adult if no count is given, but with less confidence
+    passenger_matches = list(PASSENGER_PATTERN.finditer(text))
+    if len(passenger_matches) > 1:
+        return None, 0.0
+
+    # Anything else in the request (a second date, "nonstop", "under $200", "evening") can't be searched for here
+    spans = [airport_span, date_span] + [match.span() for match in passenger_matches]
+    words = unparsed_words(text, spans)
+    if words:
+        logger.debug(f"Not a simple search, unparsed words: {words}")
+        return None, 0.0
+
+    if passenger_matches:
+        passenger_count = parse_number(passenger_matches[0].group("count"))
+        confidence = 1.0
+    else:
+        passenger_count = 1
+        confidence = 0.8
+    if not 1 <= passenger_count <= 8:
+        return None, 0.0
+
+    event = {
+        "departure_date": departure_date.isoformat(),
+        "origination": origination,
+        "destination": destination,
+        "passenger_count": passenger_count,
+        "adult_count": passenger_count,
+    }
+    return event, confidence
+
+def parse_price(price):
+    """
+    Parse a price like "$123", or None if it is unavailable.
+    """
+    try:
+        return float(price.replace("$", "").replace(",", ""))
+    except ValueError:
+        return None
+
+def format_flights_response(event, observation):
+    """
+    Format the SearchSouthwestFlightsTool observation as a customer support answer.
+    """
+    flights = json.loads(observation).get("flights") or []
+    route = f"from {event['origination']} to {event['destination']} on {event['departure_date']}"
+    travelers = f"{event['adult_count']} adult{'s' if event['adult_count'] != 1 else ''}"
+
+    if not flights:
+        return f"Sorry, I couldn't find any Southwest flights {route} for {travelers}."
+
+    lines = []
+    cheapest = None
+    for flight in flights:
+        fares = [
+            (parse_price(price), fare_type, price)
+            for fare_type, price, _ in flight["prices_and_seats_left"]
+            if parse_price(price) is not None
+        ]
+        stops = "Nonstop" if flight["number_of_stops"] == "0" else f"{flight['number_of_stops']} stop(s)"
+        line = f"- Flight {flight['flight_number']}: departs {flight['departure_time']}, arrives {flight['arrival_time']} ({flight['duration']}, {stops})"
+        if fares:
+            lowest = min(fares)
+            line += f", from {lowest[2]} ({lowest[1]})"
+            if cheapest is None or lowest[0] < cheapest[0]:
+                cheapest = (lowest[0], lowest[2], flight["flight_number"])
+        else:
+            line += ", sold out"
+        lines.append(line)
+
+    output = f"I found {len(flights)} Southwest flights {route} for {travelers}."
+    if cheapest is not None:
+        output += f" The cheapest fare is {cheapest[1]} on flight {cheapest[2]}."
+    output += "\n\n" + "\n".join(lines)
+    return output
+
+def try_fast_path(user_input, search_tool, memory=None, callbacks=None, today=None):
+    """
+    Answer a simple flight search without the LLM.
+
+    Returns a response shaped like the AgentExecutor's, or None if the caller should fall back to the agent.
+    """
+    event, confidence = parse_flight_search(user_input, today)
+    if event is None or confidence < CONFIDENCE_THRESHOLD:
+        return None
+
+    tool_input = json.dumps(event)
+    logger.info(f"Fast path search (confidence {confidence:.2f}): {tool_input}")
+    try:
+        observation = search_tool.run(tool_input, callbacks=callbacks)
+        output = format_flights_response(event, observation)
+    except Exception as e:
+        logger.warning(f"Fast path failed, falling back to the agent: {e}")
+        return None
+
+    # Keep the conversation history consistent with a normal turn
+    if memory is not None:
+        memory.save_context({"input": user_input}, {"output": output})
+
+    action = AgentAction(search_tool.name, tool_input, f"Fast path: parsed the search without the LLM (confidence {confidence:.2f}).")
+    return {
+        "input": user_input,
+        "output": output,
+        "intermediate_steps": [(action, observation)],
+        "fast_path": True,
+    }
@@ -0,0 +1,533 @@
+"""
+Scrape job queue.
+
+Scrapes used to run inline in the app.index request handler, tying the API's capacity to the browsers on the same box.
+Instead, the API submits each search as a job to a broker and workers run the jobs, each worker owning a pool of
+browsers. Workers can be threads in the app, or separate processes (on any box that can reach the broker).
+
+Brokers: InProcessBroker keeps the queue in memory, for workers running in the app process. SQLiteBroker keeps it in a
+shared database file, for worker processes on the same box. Implement the Broker interface to plug in a networked
+broker (e.g. Redis) and scale workers across boxes.
+
+Interactive searches run before prefetch searches. When the queue is saturated, submit raises QueueFull with a retry
+after estimate, which the API returns as a 429 response.
+
+Usage:
+    python jobs.py --db jobs.db --workers 4 --browsers 2
+"""
+
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import partial
+from scrape import main, initialize_parse_executor, BrowserPool, FlightsEncoder, PARSE_EXECUTOR, PARSE_WORKERS
+
+# Where jobs are queued: "inprocess" (in memory) or "sqlite" (a database file shared by worker processes)
+QUEUE_BACKEND = os.environ.get("QUEUE_BACKEND", "inprocess")
+
+# The database file of the sqlite backend
+QUEUE_DB = os.environ.get("QUEUE_DB", "jobs.db")
+
+# Number of worker threads the app starts, set to 0 when separate worker processes run the jobs
+QUEUE_WORKERS = int(os.environ.get("QUEUE_WORKERS", 1))
+
+# Number of browsers (concurrent scrapes) per worker
+BROWSERS = int(os.environ.get("QUEUE_BROWSERS", 2))
+
+# Maximum number of queued jobs before submissions are rejected. Prefetch jobs may only fill half the queue, so there
+# is always room left for interactive searches.
+MAX_QUEUED_JOBS = int(os.environ.get("QUEUE_MAX_JOBS", 32))
+
+# Maximum number of seconds to wait for a job to finish
+JOB_TIMEOUT = 120
+
+# Number of seconds after which a running job is assumed lost (e.g. its worker process crashed) and is queued again
+QUEUE_LEASE = int(os.environ.get("QUEUE_LEASE", JOB_TIMEOUT))
+
+# Job priorities, lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 10
+PRIORITIES = {
+    "interactive": PRIORITY_INTERACTIVE,
+    "prefetch": PRIORITY_PREFETCH,
+}
+
+logger = logging.getLogger(__name__)
+
+class QueueFull(Exception):
+    """
+    The queue is saturated, retry the job after retry_after seconds.
+    """
+    def __init__(self, retry_after):
+        super().__init__(f"The queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class Job():
+    """
+    A scrape job.
+    """
+    def __init__(
+        self,
+        id,
+        event,
+        priority,
+        status="queued",
+        result=None,
+        error=None,
+        created_at=None,
+        started_at=None,
+        finished_at=None
+    ):
+        self.id = id
+        self.event = event
+        self.priority = priority
+        self.status = status
+        self.result = result
+        self.error = error
+        self.created_at = created_at if created_at is not None else time.time()
+        self.started_at = started_at
+        self.finished_at = finished_at
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+class Broker(ABC):
+    """
+    Interface of a job broker.
+
+    Jobs are claimed in priority order, then oldest first. Subclasses implement the storage.
+    """
+    def __init__(self, max_queued=MAX_QUEUED_JOBS):
+        self.max_queued = max_queued
+
+    @abstractmethod
+    def submit(self, event, priority=PRIORITY_INTERACTIVE):
+        """
+        Queue a job for the event, returning its id. Raises QueueFull if the queue is saturated.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim(self, timeout=1.0):
+        """
+        Claim the next job to run, or return None if there is none within the timeout.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def complete(self, job_id, result):
+        """
+        Store the result of a job.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def fail(self, job_id, error):
+        """
+        Store the error of a failed job.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, job_id):
+        """
+        Get a job, or None if it doesn't exist.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def forget(self, job_id):
+        """
+        Delete a job once its result has been read.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def cancel(self, job_id):
+        """
+        Cancel a job nobody waits for anymore. A queued job is never run, the result of a running job is dropped.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def depth(self):
+        """
+        The number of queued jobs.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def average_duration(self):
+        """
+        The average number of seconds recent jobs took to run.
+        """
+        raise NotImplementedError
+
+    def wait(self, job_id, timeout=JOB_TIMEOUT, interval=0.05):
+        """
+        Wait for a job to finish and return it. Raises TimeoutError, and cancels the job, if it doesn't finish in time.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                raise KeyError(f"Unknown job {job_id}")
+            if job.finished:
+                self.forget(job_id)
+                return job
+            if time.monotonic() >= deadline:
+                self.cancel(job_id)
+                raise TimeoutError(f"Job {job_id} didn't finish within {timeout}s")
+            time.sleep(interval)
+
+    def check_capacity(self, priority, depth):
+        """
+        Raise QueueFull if a job with the priority can't be queued behind depth jobs.
+        """
+        limit = self.max_queued if priority <= PRIORITY_INTERACTIVE else self.max_queued // 2
+        if depth >= limit:
+            # A slot frees up roughly every time a job finishes
+            retry_after = max(1, math.ceil(self.average_duration()))
+            raise QueueFull(retry_after)
+
+class InProcessBroker(Broker):
+    """
+    Broker that keeps the queue in memory, for workers in the same process.
+    """
+    def __init__(self, max_queued=MAX_QUEUED_JOBS):
+        super().__init__(max_queued)
+        self._jobs = {}
+        self._queue = []
+        self._ids = itertools.count(1)
+        self._durations = []
+        self._condition = threading.Condition()
+
+    def submit(self, event, priority=PRIORITY_INTERACTIVE):
+        with self._condition:
+            self.check_capacity(priority, len(self._queue))
+            job = Job(next(self._ids), event, priority)
+            self._jobs[job.id] = job
+            heapq.heappush(self._queue, (priority, job.id))
+            self._condition.notify_all()
+            return job.id
+
+    def claim(self, timeout=1.0):
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._queue, timeout):
+                return None
+            _, job_id = heapq.heappop(self._queue)
+            job = self._jobs[job_id]
+            job.status = "running"
+            job.started_at = time.time()
+            return job
+
+    def complete(self, job_id, result):
+        self._finish(job_id, "done", result=result)
+
+    def fail(self, job_id, error):
+        self._finish(job_id, "failed", error=error)
+
+    def get(self, job_id):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def forget(self, job_id):
+        with self._condition:
+            self._jobs.pop(job_id, None)
+
+    def cancel(self, job_id):
+        with self._condition:
+            job = self._jobs.pop(job_id, None)
+            if job is not None and job.status == "queued":
+                self._queue = [(priority, id) for priority, id in self._queue if id != job_id]
+                heapq.heapify(self._queue)
+
+    def depth(self):
+        with self._condition:
+            return len(self._queue)
+
+    def average_duration(self):
+        with self._condition:
+            if not self._durations:
+                return 0.0
+            return sum(self._durations) / len(self._durations)
+
+    def wait(self, job_id, timeout=JOB_TIMEOUT, interval=None):
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None:
+                raise KeyError(f"Unknown job {job_id}")
+            if not self._condition.wait_for(lambda: job.finished, timeout):
+                self.cancel(job_id)
+                raise TimeoutError(f"Job {job_id} didn't finish within {timeout}s")
+            self._jobs.pop(job_id, None)
+            return job
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.status = status
+            job.result = result
+            job.error = error
+            job.finished_at = time.time()
+            self._durations = (self._durations + [job.finished_at - job.started_at])[-20:]
+            self._condition.notify_all()
+
+class SQLiteBroker(Broker):
+    """
+    Broker that keeps the queue in a sqlite database file, shared by worker processes on the same box.
+    """
+    def __init__(self, path=QUEUE_DB, max_queued=MAX_QUEUED_JOBS, lease=QUEUE_LEASE):
+        super().__init__(max_queued)
+        self.path = path
+        self.lease = lease
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+                """
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, id)")
+
+    def _connect(self):
+        # A connection per call, as sqlite connections can't be shared between threads
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def submit(self, event, priority=PRIORITY_INTERACTIVE):
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                depth = connection.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                self.check_capacity(priority, depth)
+                cursor = connection.execute(
+                    "INSERT INTO jobs (event, priority, status, created_at) VALUES (?, ?, 'queued', ?)",
+                    (json.dumps(event), priority, time.time())
+                )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            return cursor.lastrowid
+
+    def claim(self, timeout=1.0, interval=0.05):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._connect() as connection:
+                connection.execute("BEGIN IMMEDIATE")
+                # Queue the jobs of workers that died mid job again
+                connection.execute(
+                    "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running' AND started_at < ?",
+                    (time.time() - self.lease,)
+                )
+                row = connection.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority, id LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    started_at = time.time()
+                    connection.execute(
+                        "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+                        (started_at, row["id"])
+                    )
+                connection.execute("COMMIT")
+            if row is not None:
+                job = self._to_job(row)
+                job.status = "running"
+                job.started_at = started_at
+                return job
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(interval)
+
+    def complete(self, job_id, result):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'done', result = ?, finished_at = ? WHERE id = ?",
+                (result, time.time(), job_id)
+            )
+
+    def fail(self, job_id, error):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (error, time.time(), job_id)
+            )
+
+    def get(self, job_id):
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row is not None else None
+
+    def forget(self, job_id):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def cancel(self, job_id):
+        # A queued job is never claimed, and completing a running one updates nothing
+        self.forget(job_id)
+
+    def depth(self):
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def average_duration(self):
+        with self._connect() as connection:
+            average = connection.execute(
+                """
+                SELECT AVG(finished_at - started_at) FROM (
+                    SELECT started_at, finished_at FROM jobs
+                    WHERE finished_at IS NOT NULL
+                    ORDER BY finished_at DESC LIMIT 20
+                )
+                """
+            ).fetchone()[0]
+        return average or 0.0
+
+    def _to_job(self, row):
+        return Job(
+            row["id"],
+            json.loads(row["event"]),
+            row["priority"],
+            status=row["status"],
+            result=row["result"],
+            error=row["error"],
+            created_at=row["created_at"],
+            started_at=row["started_at"],
+            finished_at=row["finished_at"]
+        )
+
+def initialize_broker(backend=QUEUE_BACKEND, path=QUEUE_DB, max_queued=MAX_QUEUED_JOBS):
+    """
+    Initialize the job broker.
+    """
+    if backend == "inprocess":
+        return InProcessBroker(max_queued)
+    if backend == "sqlite":
+        return SQLiteBroker(path, max_queued)
+    raise ValueError(f"Unknown queue backend {backend!r}, expected inprocess or sqlite")
+
+async def scrape_flights(event, browser_pool, debug=False):
+    """
+    Scrape the flights of a job with a browser from the pool.
+    """
+    return await main(event, debug, browser_pool=browser_pool)
+
+async def run_worker_async(broker, browsers=BROWSERS, scrape=scrape_flights, stop=None):
+    """
+    Run jobs from the broker until stopped, with one scrape at a time per browser.
+    """
+    browser_pool = BrowserPool(browsers)
+
+    async def run_jobs():
+        while stop is None or not stop.is_set():
+            job = await asyncio.to_thread(broker.claim, 1.0)
+            if job is None:
+                continue
+            try:
+                flights = await scrape(job.event, browser_pool)
+                broker.complete(job.id, json.dumps(flights, cls=FlightsEncoder))
+            except Exception as e:
+                logger.exception(f"Job {job.id} failed")
+                broker.fail(job.id, f"{type(e).__name__}: {e}")
+
+    try:
+        await asyncio.gather(*[run_jobs() for _ in range(browsers)])
+    finally:
+        await browser_pool.close()
+
+def run_worker(broker, browsers=BROWSERS, scrape=scrape_flights, stop=None):
+    """
+    Run a worker until stopped.
+    """
+    asyncio.run(run_worker_async(broker, browsers, scrape, stop))
+
+def start_worker_threads(broker, workers=QUEUE_WORKERS, browsers=BROWSERS, scrape=scrape_flights, stop=None):
+    """
+    Start workers as daemon threads of this process.
+    """
+    threads = []
+    for i in range(workers):
+        thread = threading.Thread(
+            target=run_worker,
+            args=(broker, browsers, scrape, stop),
+            name=f"scrape-worker-{i}",
+            daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+    return threads
+
+def run_worker_process(path, browsers, scrape, stop, parse_workers=PARSE_WORKERS):
+    """
+    Run a worker process against the sqlite broker.
+    """
+    initialize_parse_executor(PARSE_EXECUTOR, parse_workers)
+    run_worker(SQLiteBroker(path), browsers, scrape, stop)
+
+def start_worker_processes(path=QUEUE_DB, workers=1, browsers=BROWSERS, scrape=scrape_flights, stop=None):
+    """
+    Start worker processes against the sqlite broker. Each process owns its own pool of browsers.
+    """
+    # Share the parse workers between the processes, rather than each starting one per core
+    parse_workers = max(1, PARSE_WORKERS // workers)
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for i in range(workers):
+        process = context.Process(
+            target=run_worker_process,
+            args=(path, browsers, scrape, stop, parse_workers),
+            name=f"scrape-worker-{i}"
+        )
+        process.start()
+        processes.append(process)
+    return processes
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=QUEUE_DB, help="The sqlite database file of the queue.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes.")
+    parser.add_argument("--browsers", type=int, default=BROWSERS, help="Number of browsers per worker.")
+    parser.add_argument("--debug", action="store_true", help="Replay debug.html instead of scraping.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    stop = multiprocessing.get_context("spawn").Event()
+    processes = start_worker_processes(
+        args.db,
+        args.workers,
+        args.browsers,
+        partial(scrape_flights, debug=args.debug),
+        stop
+    )
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for process in processes:
+            process.join()
@@ -0,0 +1,149 @@
+"""
+Multi-action structured chat agent with parallel tool execution.
+
+The stock structured chat agent allows only ONE action per $JSON_BLOB, so comparing several dates or airports runs
+one search after another, each costing a full LLM round trip plus a scrape. Here the agent may instead emit a JSON
+list of actions in one step. The executor runs those actions concurrently (with a bounded limit) and merges all the
+observations into the scratchpad before the next LLM step.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, List, Optional, Union
+from langchain.agents import AgentExecutor
+from langchain.agents.format_scratchpad import format_log_to_str
+from langchain.agents.output_parsers import JSONAgentOutputParser
+from langchain.tools.render import render_text_description_and_args
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers.json import parse_json_markdown
+from langchain_core.runnables import RunnablePassthrough
+
+# Maximum number of tool calls that run at the same time
+MAX_CONCURRENCY = 4
+
+logger = logging.getLogger(__name__)
+
+class MultiActionJSONAgentOutputParser(JSONAgentOutputParser):
+    """
+    Parses a single JSON action, or a JSON list of actions that should run in parallel.
+    """
+    @property
+    def OutputType(self):
+        return Union[List[AgentAction], AgentFinish]
+
+    def parse(self, text):
+        try:
+            response = parse_json_markdown(text)
+            if not isinstance(response, list):
+                response = [response]
+            if not response:
+                raise ValueError("Expected at least one action")
+
+            # A final answer always ends the turn, even if it was mixed in with tool actions
+            for item in response:
+                if item["action"] == "Final Answer":
+                    return AgentFinish({"output": item["action_input"]}, text)
+
+            # Only the first action carries the LLM output, otherwise the scratchpad repeats it before every observation
+            return [
+                AgentAction(item["action"], item.get("action_input", {}), text if i == 0 else "")
+                for i, item in enumerate(response)
+            ]
+        except Exception as e:
+            raise OutputParserException(f"Could not parse LLM output: {text}") from e
+
+    @property
+    def _type(self):
+        return "multi-action-json-agent"
+
+def create_multi_action_structured_chat_agent(llm, tools, prompt, stop_sequence=True):
+    """
+    Create a structured chat agent that may emit a list of actions in a single step.
+
+    Same as langchain's `create_structured_chat_agent`, but with an output parser that accepts a JSON list.
+    """
+    missing_vars = {"tools", "tool_names", "agent_scratchpad"}.difference(
+        prompt.input_variables + list(prompt.partial_variables)
+    )
+    if missing_vars:
+        raise ValueError(f"Prompt missing required variables: {missing_vars}")
+
+    prompt = prompt.partial(
+        tools=render_text_description_and_args(list(tools)),
+        tool_names=", ".join([t.name for t in tools]),
+    )
+    if stop_sequence:
+        stop = ["\nObservation"] if stop_sequence is True else stop_sequence
+        llm_with_stop = llm.bind(stop=stop)
+    else:
+        llm_with_stop = llm
+
+    agent = (
+        RunnablePassthrough.assign(
+            agent_scratchpad=lambda x: format_log_to_str(x["intermediate_steps"]),
+        )
+        | prompt
+        | llm_with_stop
+        | MultiActionJSONAgentOutputParser()
+    )
+    return agent
+
+class ParallelAgentExecutor(AgentExecutor):
+    """
+    Agent executor that runs all the actions of a step concurrently.
+    """
+    max_concurrency: int = MAX_CONCURRENCY
+    """Maximum number of tool calls that run at the same time."""
+
+    thread_initializer: Optional[Callable[[], Any]] = None
+    """Called in every worker thread before it runs a tool, e.g. to attach the Streamlit script context."""
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        # Defer the tool call, _iter_next_step runs all the actions of the step together
+        return partial(
+            super()._perform_agent_action,
+            name_to_tool_map,
+            color_mapping,
+            agent_action,
+            run_manager
+        )
+
+    def _iter_next_step(
+        self,
+        name_to_tool_map,
+        color_mapping,
+        inputs,
+        intermediate_steps,
+        run_manager=None
+    ):
+        # Plan the step, collecting the deferred tool calls rather than running them one by one
+        deferred_actions = []
+        for output in super()._iter_next_step(
+            name_to_tool_map,
+            color_mapping,
+            inputs,
+            intermediate_steps,
+            run_manager
+        ):
+            if isinstance(output, partial):
+                deferred_actions.append(output)
+            else:
+                yield output
+
+        if not deferred_actions:
+            return
+        if len(deferred_actions) == 1:
+            yield deferred_actions[0]()
+            return
+
+        # Run the tool calls concurrently, yielding the observations in the order the agent asked for them
+        logger.info(f"Running {len(deferred_actions)} actions with up to {self.max_concurrency} at a time...")
+        with ThreadPoolExecutor(
+            max_workers=min(self.max_concurrency, len(deferred_actions)),
+            initializer=self.thread_initializer
+        ) as executor:
+            futures = [executor.submit(action) for action in deferred_actions]
+            for future in futures:
+                yield future.result()
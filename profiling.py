@@ -0,0 +1,161 @@
+"""
+Profiling of agent turns.
+
+A TurnProfiler is passed as a callback to every turn, whichever path answers it (fast path, cached answer or the
+AgentExecutor). It records each LLM call (latency, prompt and completion tokens), each tool call (latency) and the
+parse error retries from handle_parsing_errors, which show up as calls to the "_Exception" tool. The breakdown is
+shown in the Streamlit UI and logged as one JSON line per turn on the "profiling" logger for offline analysis.
+"""
+
+import json
+import logging
+import threading
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+from cache import PARSE_ERROR_TOOL
+
+logger = logging.getLogger(__name__)
+
+def token_usage(llm_output):
+    """
+    Get the prompt and completion tokens of an LLM call.
+    OpenAI reports them in llm_output["token_usage"], Bedrock in llm_output["usage"].
+    """
+    usage = (llm_output or {}).get("token_usage") or (llm_output or {}).get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens", usage.get("input_tokens", 0))
+    completion_tokens = usage.get("completion_tokens", usage.get("output_tokens", 0))
+    return int(prompt_tokens or 0), int(completion_tokens or 0)
+
+class TurnProfiler(BaseCallbackHandler):
+    """
+    Callback handler that profiles a single agent turn.
+    Tools may run in parallel threads, so every update is made under a lock.
+    """
+    def __init__(self, user_input=""):
+        self.user_input = user_input
+        self.started_at = time.time()
+        self.path = None
+        self.elapsed = None
+        self.llm_calls = []
+        self.tool_calls = []
+        self._start = time.perf_counter()
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def _begin(self, run_id, **info):
+        with self._lock:
+            self._running[run_id] = dict(info, start=time.perf_counter())
+
+    def _end(self, run_id, calls, **info):
+        with self._lock:
+            call = self._running.pop(run_id, None)
+            if call is None:
+                return
+            start = call.pop("start")
+            call.update(info)
+            call["latency"] = time.perf_counter() - start
+            call["offset"] = start - self._start
+            calls.append(call)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._begin(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._begin(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens, completion_tokens = token_usage(response.llm_output)
+        self._end(
+            run_id,
+            self.llm_calls,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            error=None
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, self.llm_calls, prompt_tokens=0, completion_tokens=0, error=repr(error))
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._begin(run_id, name=(serialized or {}).get("name", "unknown"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id, self.tool_calls, error=None)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, self.tool_calls, error=repr(error))
+
+    def finish(self, response):
+        """
+        Record how the turn was answered and its total time. The response is None if the turn failed.
+        """
+        if response is None:
+            self.path = "error"
+        elif response.get("fast_path"):
+            self.path = "fast_path"
+        elif response.get("cached"):
+            self.path = "cached"
+        else:
+            self.path = "agent"
+        self.elapsed = time.perf_counter() - self._start
+
+    @property
+    def parse_errors(self):
+        return sum(1 for call in self.tool_calls if call["name"] == PARSE_ERROR_TOOL)
+
+    def to_dict(self):
+        """
+        The profile of the turn as a JSON serializable dict.
+        """
+        llm_calls = [dict(call, latency=round(call["latency"], 3), offset=round(call["offset"], 3)) for call in self.llm_calls]
+        tool_calls = [
+            dict(call, latency=round(call["latency"], 3), offset=round(call["offset"], 3))
+            for call in self.tool_calls
+            if call["name"] != PARSE_ERROR_TOOL
+        ]
+        return {
+            "started_at": self.started_at,
+            "input": self.user_input,
+            "path": self.path,
+            "elapsed": round(self.elapsed, 3) if self.elapsed is not None else None,
+            "llm_call_count": len(llm_calls),
+            "llm_latency": round(sum(call["latency"] for call in self.llm_calls), 3),
+            "prompt_tokens": sum(call["prompt_tokens"] for call in llm_calls),
+            "completion_tokens": sum(call["completion_tokens"] for call in llm_calls),
+            "tool_call_count": len(tool_calls),
+            "tool_latency": round(sum(call["latency"] for call in tool_calls), 3),
+            "parse_errors": self.parse_errors,
+            "llm_calls": llm_calls,
+            "tool_calls": tool_calls,
+        }
+
+    def log(self):
+        """
+        Log the profile of the turn as a single JSON line.
+        """
+        logger.info(json.dumps(self.to_dict()))
+
+    def report(self):
+        """
+        Markdown breakdown of the turn for the Streamlit UI.
+        """
+        profile = self.to_dict()
+        lines = [
+            f"**{profile['elapsed'] or 0:.2f}s** total ({profile['path']}): "
+            f"{profile['llm_call_count']} LLM call(s) in {profile['llm_latency']:.2f}s, "
+            f"{profile['tool_call_count']} tool call(s) in {profile['tool_latency']:.2f}s, "
+            f"{profile['prompt_tokens']} prompt + {profile['completion_tokens']} completion tokens, "
+            f"{profile['parse_errors']} parse error retries",
+            "",
+            "| Step | Start (s) | Latency (s) | Tokens (prompt / completion) |",
+            "| --- | ---: | ---: | --- |",
+        ]
+        # Parallel tool calls overlap, so list the steps by when they started
+        steps = [(call["offset"], "LLM", call) for call in profile["llm_calls"]]
+        steps += [(call["offset"], call["name"], call) for call in profile["tool_calls"]]
+        for offset, name, call in sorted(steps, key=lambda step: step[0]):
+            tokens = f"{call['prompt_tokens']} / {call['completion_tokens']}" if name == "LLM" else ""
+            if call["error"]:
+                name += " (error)"
+            lines.append(f"| {name} | {offset:.2f} | {call['latency']:.2f} | {tokens} |")
+        return "\n".join(lines)
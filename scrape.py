@@ -1,7 +1,7 @@
 """
 Tutorial: https://github.com/Erik-Debye/SWA-Scraper/blob/main/javascript%20modules/scraper.js
 
-NOTE: Does not assume multiple pages of flights!
+NOTE: Follows up to MAX_PAGES pages of flights, and round trips are scraped in a single browser session.
 NOTE: Web Scraping buggy when get redirected to booking page (index.html) rather than select flights page (select-flights.html)!
 """
 
@@ -12,7 +12,34 @@ from pyppeteer import launch
 from bs4 import BeautifulSoup
 from random_user_agent.user_agent import UserAgent
 from random_user_agent.params import SoftwareName, OperatingSystem
+from pyppeteer.errors import TimeoutError as PageTimeoutError
+from bs4 import SoupStrainer
 import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from airports import validate_event
+
+# Where the HTML is parsed: "process" (a process pool), "thread" (a thread pool) or "inline" (on the event loop).
+# Parsing is CPU-bound, so a process pool keeps the event loop responsive during concurrent scrapes.
+PARSE_EXECUTOR = os.environ.get("PARSE_EXECUTOR", "process")
+
+# Number of parse workers, one per core by default
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", os.cpu_count() or 1))
+
+# Maximum number of pages of flights to scrape
+MAX_PAGES = 5
+
+# The enabled button that shows the next page of flights
+NEXT_PAGE_SELECTOR = 'button[aria-label="Next page"]:not([disabled])'
+
+# The id of each result matrix (list of flights) on the page
+MATRIX_ID_PATTERN = re.compile(r'id="air-search-results-matrix-(\d+)"')
+
+logger = logging.getLogger(__name__)
 
 class Flights():
     """
@@ -25,7 +52,9 @@ class Flights():
         destination_airport,
         passenger_count,
         adult_count,
-        flights=None
+        flights=None,
+        return_date=None,
+        return_flights=None
     ):
         self.departure_date = departure_date
         self.origination_airport = origination_airport
@@ -33,6 +62,31 @@ class Flights():
         self.passenger_count = passenger_count
         self.adult_count = adult_count
         self.flights = flights
+        self.return_date = return_date
+        self.return_flights = return_flights
+
+    def is_return_matrix(self, matrix_index):
+        """
+        Whether a result matrix holds return flights. Round trip pages alternate outbound and return matrices.
+        """
+        return self.return_date is not None and matrix_index % 2 == 1
+
+    def matrix_leg(self, matrix_index):
+        """
+        The departure date, origination and destination airports of the flights in a result matrix.
+        """
+        if self.is_return_matrix(matrix_index):
+            return self.return_date, self.destination_airport, self.origination_airport
+        return self.departure_date, self.origination_airport, self.destination_airport
+
+    def add_flights(self, matrix_index, flights):
+        """
+        Add the flights parsed from a result matrix, skipping flights already seen on another page.
+        """
+        if self.is_return_matrix(matrix_index):
+            self.return_flights = merge_flights(self.return_flights, flights)
+        else:
+            self.flights = merge_flights(self.flights, flights)
 
     def compute_cheapest_flight(self):
         """
@@ -56,6 +110,8 @@ class Flights():
         output += f"Destination Airport: {self.destination_airport}\n"
         output += f"Passenger Count: {self.passenger_count}\n"
         output += f"Adult Count: {self.adult_count}\n"
+        if self.return_date is not None:
+            output += f"Return Date: {self.return_date}\n"
         output += f"Total Flights Available: {len(self.flights)}\n"
         output += f"Cheapest Flight Price: {self.compute_cheapest_flight()}\n"
         output += f"\n\n"
@@ -63,8 +119,25 @@ class Flights():
         for flight in self.flights:
             output += str(flight)
 
+        if self.return_flights:
+            output += f"Total Return Flights Available: {len(self.return_flights)}\n\n"
+            for flight in self.return_flights:
+                output += str(flight)
+
         return output
 
+def merge_flights(flights, new_flights):
+    """
+    Merge newly parsed flights into a list of flights, skipping duplicates.
+    """
+    flights = flights or []
+    seen = {(flight.flight_number, flight.departure_time) for flight in flights}
+    for flight in new_flights:
+        if (flight.flight_number, flight.departure_time) not in seen:
+            seen.add((flight.flight_number, flight.departure_time))
+            flights.append(flight)
+    return flights
+
 class FlightsEncoder(json.JSONEncoder):
         """
         JSON Encoder Class for the Flights Class.
@@ -103,6 +176,15 @@ class Flight():
         self.duration = self.parse_duration(html)
         self.prices_and_seats_left = self.parse_prices_and_seats_left(html)
 
+    @classmethod
+    def from_record(cls, record):
+        """
+        Initialize a flight from a record made by parse_flight_records, without parsing any HTML.
+        """
+        flight = cls.__new__(cls)
+        flight.__dict__.update(record)
+        return flight
+
     def parse_flight_number(self, html):
         """
         Parse the flight number.
@@ -230,35 +312,163 @@ class FlightEncoder(json.JSONEncoder):
         def default(self, o):
             return o.__dict__
 
-def parse_html(flights, html):
+def find_result_matrices(html):
     """
-    Parse the HTML.
+    Find the index of every result matrix in the HTML.
+    """
+    return sorted({int(matrix_index) for matrix_index in MATRIX_ID_PATTERN.findall(html)})
+
+def parse_matrix(
+    html,
+    matrix_index,
+    departure_date,
+    origination_airport,
+    destination_airport,
+    passenger_count,
+    adult_count
+):
     """
-    # Store a list of parsed flights
+    Parse the flights in one result matrix of the HTML.
+    """
+    # Only build the tree for this matrix
+    matrix_id = f"air-search-results-matrix-{matrix_index}"
+    soup = BeautifulSoup(html, "html.parser", parse_only=SoupStrainer("ul", {"id": matrix_id}))
+    matrix = soup.find('ul', {"id": matrix_id})
+    if matrix is None:
+        return []
+
+    # Parse each flight in the matrix
     parsed_flights = []
-
-    # Initialize HTML parser
-    soup = BeautifulSoup(html, "html.parser")
-
-    # Parse each flight in the HTML
-    flight_html_list = soup.find('ul', {"id": "air-search-results-matrix-0"}).find_all('li')
-    for flight_html in flight_html_list:
+    for flight_html in matrix.find_all('li'):
         flight = Flight(
-            flights.departure_date,
-            flights.origination_airport,
-            flights.destination_airport,
-            flights.passenger_count,
-            flights.adult_count,
+            departure_date,
+            origination_airport,
+            destination_airport,
+            passenger_count,
+            adult_count,
             flight_html
             )
         parsed_flights.append(flight)
 
-    # Store the parsed flights
-    flights.flights = parsed_flights
+    return parsed_flights
+
+def parse_html(flights, html):
+    """
+    Parse the HTML.
+    """
+    # Parse each result matrix in the HTML
+    for matrix_index in find_result_matrices(html):
+        departure_date, origination_airport, destination_airport = flights.matrix_leg(matrix_index)
+        parsed_flights = parse_matrix(
+            html,
+            matrix_index,
+            departure_date,
+            origination_airport,
+            destination_airport,
+            flights.passenger_count,
+            flights.adult_count
+        )
+
+        # Store the parsed flights
+        flights.add_flights(matrix_index, parsed_flights)
+
+def parse_flight_records(
+    html,
+    matrix_index,
+    departure_date,
+    origination_airport,
+    destination_airport,
+    passenger_count,
+    adult_count
+):
+    """
+    Parse one result matrix of the HTML into compact flight records.
+    Runs in the parse executor, so it only takes and returns picklable values.
+    """
+    parsed_flights = parse_matrix(
+        html,
+        matrix_index,
+        departure_date,
+        origination_airport,
+        destination_airport,
+        passenger_count,
+        adult_count
+    )
+    return [flight.__dict__ for flight in parsed_flights]
+
+# The parse executor and its kind, created on first use
+_parse_executor = None
+_parse_executor_kind = None
+_parse_executor_lock = threading.Lock()
 
-async def extract_html(url, debug):
+def initialize_parse_executor(kind=PARSE_EXECUTOR, workers=PARSE_WORKERS):
     """
-    Extract the HTML from the URL.
+    Initialize the executor that parses HTML off the event loop, replacing the current one.
+    """
+    global _parse_executor, _parse_executor_kind
+    if _parse_executor is not None:
+        _parse_executor.shutdown()
+
+    if kind == "process":
+        # Spawn rather than fork, as forking a threaded server (Flask) can deadlock the child
+        _parse_executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    elif kind == "thread":
+        _parse_executor = ThreadPoolExecutor(max_workers=workers)
+    elif kind == "inline":
+        _parse_executor = None
+    else:
+        raise ValueError(f"Unknown parse executor {kind!r}, expected process, thread or inline")
+
+    _parse_executor_kind = kind
+    return _parse_executor
+
+async def parse_html_async(flights, pages):
+    """
+    Parse every result matrix of every page of HTML concurrently in the parse executor, without blocking the event loop.
+    """
+    if isinstance(pages, str):
+        pages = [pages]
+
+    # A page without results means the scrape was blocked or redirected
+    matrices = [(html, matrix_index) for html in pages for matrix_index in find_result_matrices(html)]
+    if not matrices:
+        raise RuntimeError("No flight results found in the HTML")
+
+    with _parse_executor_lock:
+        if _parse_executor_kind is None:
+            initialize_parse_executor()
+    if _parse_executor is None:
+        for html in pages:
+            parse_html(flights, html)
+    else:
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*[
+            loop.run_in_executor(
+                _parse_executor,
+                parse_flight_records,
+                html,
+                matrix_index,
+                *flights.matrix_leg(matrix_index),
+                flights.passenger_count,
+                flights.adult_count
+            )
+            for html, matrix_index in matrices
+        ])
+
+        # Merge the flights in page order
+        for (_, matrix_index), records in zip(matrices, results):
+            flights.add_flights(matrix_index, [Flight.from_record(record) for record in records])
+
+    # The page layout may have changed, as a round trip should always have return flights
+    if flights.return_date is not None and flights.return_flights is None:
+        logger.warning(
+            f"No return flights found for the round trip {flights.origination_airport} to "
+            f"{flights.destination_airport} returning {flights.return_date}"
+        )
+
+async def launch_browser(debug):
+    """
+    Launch a browser with a random user agent.
     """
     # Get Random User Agent String.
     user_agent_rotator = UserAgent(
@@ -280,9 +490,75 @@ async def extract_html(url, debug):
         handleSIGTERM=False,
         handleSIGHUP=False
     )
+    return browser
+
+class BrowserPool():
+    """
+    A pool of browsers that are reused across scrapes, rather than launching a browser for every scrape.
+    """
+    def __init__(self, size, debug=False):
+        self.size = size
+        self.debug = debug
+        self._idle = asyncio.Queue()
+        self._browsers = []
+        self._launching = 0
+
+    async def acquire(self):
+        """
+        Take an idle browser, launching one if the pool isn't full yet.
+        """
+        if self._idle.empty() and len(self._browsers) + self._launching < self.size:
+            self._launching += 1
+            try:
+                browser = await launch_browser(self.debug)
+            finally:
+                self._launching -= 1
+            self._browsers.append(browser)
+            return browser
+        return await self._idle.get()
+
+    def release(self, browser):
+        """
+        Give a browser back to the pool.
+        """
+        self._idle.put_nowait(browser)
+
+    async def discard(self, browser):
+        """
+        Close a broken browser and remove it from the pool, so a new one is launched in its place.
+        """
+        self._browsers.remove(browser)
+        await browser.close()
+
+    async def close(self):
+        """
+        Close every browser in the pool.
+        """
+        for browser in self._browsers:
+            await browser.close()
+        self._browsers = []
+
+async def extract_html(url, debug, browser=None):
+    """
+    Extract the HTML of every page of flights from the URL.
+    Uses the given browser if there is one (and leaves it open), otherwise launches a new browser.
+    """
+    owns_browser = browser is None
+    if owns_browser:
+        browser = await launch_browser(debug)
 
     # Open a new page
     page = await browser.newPage()
+
+    async def close():
+        """
+        Close the browser window, or just the page if the browser is pooled.
+        """
+        if owns_browser:
+            await browser.close()
+        else:
+            await page.close()
+
     await page.setViewport({ "width": 1366, "height": 768})
 
     # Add stealth plugin
@@ -299,37 +575,63 @@ async def extract_html(url, debug):
         await button.click()
         try:
             await page.waitForNavigation({"timeout": 5000})
-        except TimeoutError as e:
+        except (TimeoutError, PageTimeoutError) as e:
             # Close the browser window
-            await browser.close()
+            await close()
             raise e
 
     # Extract the HTML
-    html = await page.content()
+    pages = [await page.content()]
+
+    # Extract the HTML of the following pages
+    while len(pages) < MAX_PAGES:
+        next_button = await page.querySelector(NEXT_PAGE_SELECTOR)
+        if next_button is None:
+            break
+        try:
+            await asyncio.gather(
+                page.waitForNavigation({"waitUntil": 'networkidle2', "timeout": 5000}),
+                next_button.click()
+            )
+        except PageTimeoutError:
+            # The flights were updated in place rather than on a new page
+            pass
+        html = await page.content()
+        if html == pages[-1]:
+            break
+        pages.append(html)
     
     # Close the browser window
-    await browser.close()
+    await close()
 
     # Write HTML for debugging
     with open("debug.html", "w") as f:
-        f.write(html)
+        f.write(pages[0])
 
-    return html
+    return pages
 
 def construct_url(event):
     """
     Construct the Southwest URL to scrape.
+    Raises a ValueError if the event is invalid, before any browser is launched.
     """
+    validate_event(event)
+
     departure_date = event['departure_date']
     origination = event['origination']
     destination = event['destination']
     passenger_count = event['passenger_count']
     adult_count = event['adult_count']
-    url = f"https://www.southwest.com/air/booking/select-depart.html?adultPassengersCount={passenger_count}&adultsCount={adult_count}&departureDate={departure_date}&departureTimeOfDay=ALL_DAY&destinationAirportCode={destination}&fareType=USD&from={origination}&int=HOMEQBOMAIR&originationAirportCode={origination}&passengerType=ADULT&reset=true&returnDate=&returnTimeOfDay=ALL_DAY&to={destination}&tripType=oneway"
+    return_date = event.get('return_date') or ""
+    trip_type = "roundtrip" if return_date else "oneway"
+    url = f"https://www.southwest.com/air/booking/select-depart.html?adultPassengersCount={passenger_count}&adultsCount={adult_count}&departureDate={departure_date}&departureTimeOfDay=ALL_DAY&destinationAirportCode={destination}&fareType=USD&from={origination}&int=HOMEQBOMAIR&originationAirportCode={origination}&passengerType=ADULT&reset=true&returnDate={return_date}&returnTimeOfDay=ALL_DAY&to={destination}&tripType={trip_type}"
     return url
 
-async def main(event, debug):
+async def main(event, debug, browser_pool=None):
     print(f"Debug Mode On: {debug}")
+    # Construct the URL to parse
+    url = construct_url(event)
+
     # Initialize the flights object
     flights = Flights(
         event['departure_date'],
@@ -337,23 +639,29 @@ async def main(event, debug):
         event['destination'],
         event['passenger_count'],
         event['adult_count'],
+        return_date=event.get('return_date') or None,
     )
 
-    # Construct the URL to parse
-    url = construct_url(event)
-
     # Extract the HTML
     if debug:
         filename = "debug.html"
         print(f"Reading HTML from local file {filename}...")
         f = open(filename)
-        html = f.read()
+        pages = [f.read()]
         f.close()
+    elif browser_pool is not None:
+        browser = await browser_pool.acquire()
+        try:
+            pages = await extract_html(url, debug, browser)
+        except Exception:
+            await browser_pool.discard(browser)
+            raise
+        browser_pool.release(browser)
     else:
-        html = await extract_html(url, debug)
+        pages = await extract_html(url, debug)
 
     # Parse the HTML to extract the flight information
-    parse_html(flights, html)
+    await parse_html_async(flights, pages)
 
     return flights
 
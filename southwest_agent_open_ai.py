@@ -1,4 +1,3 @@
-from langchain.agents import AgentExecutor, create_structured_chat_agent
 from langchain_openai import ChatOpenAI
 from langchain_community.chat_message_histories import StreamlitChatMessageHistory
 from langchain_core.prompts.chat import ChatPromptTemplate, MessagesPlaceholder
@@ -7,10 +6,19 @@ from langchain_core.runnables import RunnableConfig
 from langchain.memory import ConversationBufferMemory
 from langchain.tools import tool
 from langchain.agents import Tool
+from airports import lookup_airports, validate_event
+from cache import get_shared_cache
+from intent import try_fast_path
+from multi_action import ParallelAgentExecutor, create_multi_action_structured_chat_agent
+from profiling import TurnProfiler
 import requests
 import json
+import logging
 import os
 
+# Configure logging, turn profiles are logged as JSON lines
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
 # ------------------------------------------------------------------------
 # Constants
 
@@ -38,10 +46,19 @@ def search_southwest_flights(event: str) -> str:
     departure_date: str --> The date of the flight in the format yyyy-mm-dd. \
     origination: str --> The origination airport 3-letter code. Examples: SAN, LAX, SFO. \
     destination: str --> The destination airport 3-letter code. Examples: DAL, PHX, LGA. \
+    Use the LookupAirportTool to find the airport code of a city. \
     passenger_count: int --> The number of passengers. \
-    adult_count: int --> The number of adults.
+    adult_count: int --> The number of adults. \
+    return_date: str --> Optional, the date of the return flight in the format yyyy-mm-dd for round trips.
     """
     data = json.loads(event)
+
+    # Fail fast on invalid searches rather than after a full scrape
+    try:
+        validate_event(data)
+    except ValueError as e:
+        return f"Invalid search: {e}. Use the LookupAirportTool to find airport codes."
+
     response = requests.post(
         SOUTHWEST_API_URL,
         json=data
@@ -55,12 +72,24 @@ def initialize_tools():
         description="""
         Use this tool with a JSON-encoded string argument like \
         "{{"departure_date": "yyyy-mm-dd", "origination": "XXX", "destination": "YYY", "passenger_count": 1, "adult_count": 1}}" \
-        when you need to search for flights on Southwest Airlines. The input will always be a JSON encoded string with those arguments.
+        when you need to search for flights on Southwest Airlines. The input will always be a JSON encoded string with those arguments. \
+        For round trips, add a "return_date": "yyyy-mm-dd" argument to search the outbound and return flights at once.
+        """,
+    )
+
+    lookup_airport_tool = Tool(
+        name="LookupAirportTool",
+        func=lookup_airports,
+        description="""
+        Use this tool with a city, airport name or airport code (e.g. "San Diego", "Love Field", "Chicago") \
+        when you need the 3-letter code of an airport served by Southwest Airlines. \
+        Never guess airport codes, look them up with this tool. Returns the matching airports as a JSON string.
         """,
     )
 
     return [
-        search_southwest_flights_tool
+        search_southwest_flights_tool,
+        lookup_airport_tool
     ]
 
 def initialize_model(model_id, model_kwargs):
@@ -71,6 +100,11 @@ def initialize_model(model_id, model_kwargs):
     )
     return model
 
+def initialize_cache():
+    """Initialize the tool plan and final answer cache shared by every session."""
+    cache = get_shared_cache()
+    return cache
+
 def initialize_streamlit_memory():
     history = StreamlitChatMessageHistory()
     return history
@@ -108,6 +142,23 @@ def intialize_prompt():
     }}
     ```
 
+    If you need several independent searches (e.g. to compare dates or airports), you may instead provide a list of
+    SearchSouthwestFlightsTool actions as the $JSON_BLOB. They will run at the same time and you will get all of the
+    observations back together:
+
+    ```
+    [
+    {{
+    "action": "SearchSouthwestFlightsTool",
+    "action_input": $INPUT_1
+    }},
+    {{
+    "action": "SearchSouthwestFlightsTool",
+    "action_input": $INPUT_2
+    }}
+    ]
+    ```
+
     Follow this format:
 
     Question: input question to answer
@@ -126,7 +177,7 @@ def intialize_prompt():
     "action_input": "Final response to human"
     }}
 
-    Begin! Reminder to ALWAYS respond with a valid json blob of a single action. Use tools if necessary. Respond directly if appropriate. Format is Action:```$JSON_BLOB```then Observation'''
+    Begin! Reminder to ALWAYS respond with a valid json blob of a single action (or a list of searches). Use tools if necessary. Respond directly if appropriate. Format is Action:```$JSON_BLOB```then Observation'''
 
     human = '''
 
@@ -155,15 +206,20 @@ memory = initialize_memory(streamlit_memory)
 
 # Initialize the Tools
 tools = initialize_tools()
+search_tool = tools[0]
+
+# Initialize the Cache
+cache = initialize_cache()
 
 # Initialize the Agent
 system_prompt = intialize_prompt()
-agent = create_structured_chat_agent(
+agent = create_multi_action_structured_chat_agent(
     model,
     tools,
     system_prompt
 )
-executor = agent_executor = AgentExecutor(
+agent = cache.wrap_agent(agent)
+executor = agent_executor = ParallelAgentExecutor(
         agent=agent,
         tools=tools,
         memory=memory,
@@ -182,10 +238,17 @@ st.set_page_config(page_title="Southwest Generative AI Agent Demo", page_icon=":
 st.title("Southwest Generative AI Agent Demo")
 st.caption("This is a demo of a Generative AI Assistant that can use Tools to interact with Southwest Airlines.")
 
+# Initialize the session state for the profile of each answer
+if "profiles" not in st.session_state.keys():
+    st.session_state.profiles = {}
+
 # Display current chat messages
-for message in streamlit_memory.messages:
+for i, message in enumerate(streamlit_memory.messages):
     with st.chat_message(message.type):
         st.write(message.content)
+        if str(i) in st.session_state.profiles:
+            with st.expander("Profile"):
+                st.markdown(st.session_state.profiles[str(i)])
 
 # Chat Input - User Prompt 
 if user_input := st.chat_input("Message"):
@@ -196,11 +259,33 @@ if user_input := st.chat_input("Message"):
     config = {"configurable": {"session_id": "any"}}
 
     with st.chat_message("assistant"):
+        profiler = TurnProfiler(user_input)
+        cfg = RunnableConfig()
+        cfg["callbacks"] = [profiler]
         chat_history = memory.buffer_as_messages
-        response = agent_executor.invoke(
-            input={
-                "input": f"{user_input}",
-                "chat_history": chat_history,             
-            },
-        )
+
+        response = None
+        try:
+            # Simple flight searches skip the LLM entirely
+            response = try_fast_path(user_input, search_tool, memory, callbacks=cfg["callbacks"])
+            if response is None:
+                response = cache.invoke(
+                    agent_executor,
+                    user_input,
+                    chat_history,
+                    config=cfg
+                )
+        finally:
+            # Log where the time of the turn went, even if it failed
+            profiler.finish(response)
+            profiler.log()
         st.write(response["output"])
+
+        # Show where the time of the turn went
+        report = profiler.report()
+        st.session_state.profiles[str(len(streamlit_memory.messages) - 1)] = report
+        with st.expander("Profile"):
+            st.markdown(report)
+
+# Display the cache statistics
+st.sidebar.caption(cache.report())
@@ -0,0 +1,51 @@
+import pytest
+from airports import airport_index, validate_event
+
+def search_event(**overrides):
+    event = {
+        "departure_date": "2024-04-22",
+        "origination": "SAN",
+        "destination": "DAL",
+        "passenger_count": 1,
+        "adult_count": 1,
+    }
+    event.update(overrides)
+    return event
+
+def test_validate_event_accepts_searches():
+    validate_event(search_event())
+    validate_event(search_event(return_date="2024-04-25", passenger_count=3, adult_count=2))
+    validate_event(search_event(origination="HRL", destination="MYR"))
+
+def test_validate_event_normalizes_codes():
+    event = search_event(origination="san", destination="Dal")
+    validate_event(event)
+    assert event["origination"] == "SAN"
+    assert event["destination"] == "DAL"
+
+@pytest.mark.parametrize("overrides, message", [
+    ({"departure_date": "04/22/2024"}, "Invalid departure_date"),
+    ({"return_date": "2024-04-21"}, "before the departure_date"),
+    ({"return_date": "tomorrow"}, "Invalid return_date"),
+    ({"origination": "XXX"}, "Unknown origination"),
+    ({"destination": None}, "Unknown destination"),
+    ({"destination": "EWR"}, "Unknown destination"),
+    ({"destination": "san"}, "are the same"),
+    ({"passenger_count": "two"}, "must be integers"),
+    ({"passenger_count": 9, "adult_count": 9}, "passenger_count must be between"),
+    ({"passenger_count": 2, "adult_count": 3}, "adult_count must be between"),
+    ({"adult_count": 0}, "adult_count must be between"),
+])
+def test_validate_event_rejects_invalid_searches(overrides, message):
+    with pytest.raises(ValueError, match=message):
+        validate_event(search_event(**overrides))
+
+def test_validate_event_requires_every_key():
+    event = search_event()
+    del event["adult_count"]
+    with pytest.raises(ValueError, match="Missing adult_count"):
+        validate_event(event)
+
+def test_search_ranks_city_aliases_first():
+    assert [airport.code for airport in airport_index.search("chicago")][:2] == ["MDW", "ORD"]
+    assert airport_index.search("myrtle")[0].code == "MYR"
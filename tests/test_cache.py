@@ -0,0 +1,142 @@
+import json
+import threading
+import time
+import pytest
+from langchain_core.agents import AgentAction
+from langchain_core.runnables import RunnableLambda
+import cache
+from cache import AgentCache, LRUCache, is_error_observation
+
+class FakeClock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return clock
+
+def test_lru_cache_expires_entries_after_ttl(clock):
+    lru = LRUCache(max_entries=10, ttl=60)
+    lru.put("a", 1)
+    clock.now += 59
+    assert lru.get("a") == 1
+    clock.now += 2
+    assert lru.get("a") is None
+    assert len(lru) == 0
+
+def test_lru_cache_evicts_least_recently_used(clock):
+    lru = LRUCache(max_entries=2, ttl=60)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    # Reading "a" makes "b" the least recently used
+    assert lru.get("a") == 1
+    lru.put("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert lru.get("c") == 3
+
+def test_lru_cache_put_refreshes_ttl(clock):
+    lru = LRUCache(max_entries=10, ttl=60)
+    lru.put("a", 1)
+    clock.now += 50
+    lru.put("a", 2)
+    clock.now += 50
+    assert lru.get("a") == 2
+
+@pytest.mark.parametrize("observation, error", [
+    (json.dumps({"flights": []}), False),
+    (json.dumps([{"code": "SAN"}]), False),
+    (json.dumps({"error": "No Southwest airport found for 'xyz'."}), True),
+    ("Invalid search: Unknown origination airport code 'XXX'", True),
+    ("The queue is full, retry after 3s", True),
+    (None, True),
+])
+def test_is_error_observation(observation, error):
+    assert is_error_observation(observation) == error
+
+class FakeExecutor():
+    """
+    Runs the wrapped agent once and returns the given observation for its action, like an AgentExecutor turn.
+    """
+    memory = None
+
+    def __init__(self, agent, observation, fail=False):
+        self.agent = agent
+        self.observation = observation
+        self.fail = fail
+
+    def invoke(self, input, config=None):
+        action = self.agent.invoke(dict(input, intermediate_steps=[]))
+        if self.fail:
+            raise RuntimeError("scrape failed")
+        return {"output": "answer", "intermediate_steps": [(action, self.observation)]}
+
+def initialize_agent_cache():
+    agent_cache = AgentCache()
+    agent = agent_cache.wrap_agent(RunnableLambda(lambda inputs: AgentAction("SearchSouthwestFlightsTool", "{}", "log")))
+    return agent_cache, agent
+
+def test_turns_with_tool_errors_are_not_cached():
+    agent_cache, agent = initialize_agent_cache()
+    agent_cache.invoke(FakeExecutor(agent, "The queue is full, retry after 3s"), "flights SAN to DAL")
+    assert len(agent_cache.answers) == 0
+    assert len(agent_cache.plans) == 0
+
+def test_successful_turns_are_cached():
+    agent_cache, agent = initialize_agent_cache()
+    agent_cache.invoke(FakeExecutor(agent, json.dumps({"flights": []})), "flights SAN to DAL")
+    response = agent_cache.invoke(FakeExecutor(agent, "unused"), "flights SAN to DAL")
+    assert response["cached"]
+    assert agent_cache.stats["answer_hits"] == 1
+
+def test_failed_turns_dont_leak_latency():
+    agent_cache, agent = initialize_agent_cache()
+    with pytest.raises(RuntimeError):
+        agent_cache.invoke(FakeExecutor(agent, None, fail=True), "flights SAN to DAL")
+    assert agent_cache._turn.get() is None
+
+def test_overlapping_turns_keep_their_own_latency():
+    barrier = threading.Barrier(2)
+
+    def slow_agent(inputs):
+        # Both turns are planning the same question at the same time
+        barrier.wait(timeout=5)
+        time.sleep(0.05)
+        return AgentAction("SearchSouthwestFlightsTool", "{}", "log")
+
+    agent_cache = AgentCache()
+    agent = agent_cache.wrap_agent(RunnableLambda(slow_agent))
+    threads = [
+        threading.Thread(
+            target=agent_cache.invoke,
+            args=(FakeExecutor(agent, json.dumps({"flights": []})), "flights SAN to DAL")
+        )
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert agent_cache.stats["lookups"] == 2
+    assert agent_cache.stats["misses"] == 2
+    _, llm_latency = agent_cache.answers.get(agent_cache.key("flights SAN to DAL"))
+    assert 0.05 <= llm_latency < 0.5
+
+def test_plan_is_the_first_multi_action_step():
+    agent_cache = AgentCache()
+    ok = json.dumps({"flights": []})
+    steps = [
+        (AgentAction("SearchSouthwestFlightsTool", "a", "Action: [a, b]"), ok),
+        (AgentAction("SearchSouthwestFlightsTool", "b", ""), ok),
+        (AgentAction("SearchSouthwestFlightsTool", "c", "Action: c"), ok),
+    ]
+    agent_cache.store("key", {"output": "answer", "intermediate_steps": steps}, 0.5, 1.0)
+    plan_actions, latency = agent_cache.plans.get("key")
+    assert plan_actions == [("SearchSouthwestFlightsTool", "a"), ("SearchSouthwestFlightsTool", "b")]
+    assert latency == 0.5
@@ -0,0 +1,57 @@
+import json
+import pytest
+from langchain.agents import Tool
+from benchmark import FAST_PATH_CORPUS, FAST_PATH_TODAY
+from intent import CONFIDENCE_THRESHOLD, parse_flight_search, resolve_airport, try_fast_path
+
+@pytest.mark.parametrize("user_input, expected_event", FAST_PATH_CORPUS)
+def test_fast_path_corpus(user_input, expected_event):
+    event, confidence = parse_flight_search(user_input, today=FAST_PATH_TODAY)
+    if expected_event is None:
+        assert event is None or confidence < CONFIDENCE_THRESHOLD
+    else:
+        assert confidence >= CONFIDENCE_THRESHOLD
+        assert event == expected_event
+
+@pytest.mark.parametrize("text, code", [
+    ("san diego", "SAN"),
+    ("sfo", "SFO"),
+    ("chicago midway", "MDW"),
+    ("houston hobby", "HOU"),
+    ("chicago", None),
+    ("houston", None),
+    ("portland", None),
+    ("san jose", None),
+    ("new york city", None),
+    ("nyc", None),
+    ("washington", None),
+    ("gotham", None),
+])
+def test_resolve_airport(text, code):
+    assert resolve_airport(text) == code
+
+def initialize_search_tool(observation):
+    return Tool(
+        name="SearchSouthwestFlightsTool",
+        func=lambda event: observation,
+        description="Search Southwest Airlines for flights.",
+    )
+
+def test_try_fast_path_answers_simple_searches():
+    observation = json.dumps({"flights": []})
+    response = try_fast_path(
+        "flights from San Diego to Dallas on April 22nd for 1 adult",
+        initialize_search_tool(observation),
+        today=FAST_PATH_TODAY
+    )
+    assert response["fast_path"]
+    assert response["intermediate_steps"][0][1] == observation
+    assert "couldn't find any Southwest flights from SAN to DAL on 2024-04-22" in response["output"]
+
+def test_try_fast_path_falls_back_to_the_agent():
+    response = try_fast_path(
+        "flights from San Diego to Dallas on April 22nd for 1 adult, nonstop only",
+        initialize_search_tool("unused"),
+        today=FAST_PATH_TODAY
+    )
+    assert response is None
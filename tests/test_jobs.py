@@ -0,0 +1,198 @@
+import asyncio
+import json
+import multiprocessing
+import threading
+import time
+from functools import partial
+import pytest
+import app as api
+import scrape
+from benchmark import replay_scrape
+from jobs import Broker, InProcessBroker, QueueFull, SQLiteBroker, PRIORITY_INTERACTIVE, PRIORITY_PREFETCH
+from jobs import start_worker_processes, start_worker_threads
+
+EVENT = {
+    "departure_date": "2024-04-22",
+    "origination": "SAN",
+    "destination": "DAL",
+    "passenger_count": 1,
+    "adult_count": 1,
+}
+
+@pytest.fixture(params=["inprocess", "sqlite"])
+def broker(request, tmp_path):
+    if request.param == "inprocess":
+        return InProcessBroker(max_queued=4)
+    return SQLiteBroker(str(tmp_path / "jobs.db"), max_queued=4)
+
+def test_interactive_jobs_run_before_prefetch_jobs(broker):
+    prefetch_id = broker.submit(dict(EVENT, n=1), PRIORITY_PREFETCH)
+    first_id = broker.submit(dict(EVENT, n=2), PRIORITY_INTERACTIVE)
+    second_id = broker.submit(dict(EVENT, n=3), PRIORITY_INTERACTIVE)
+    assert [broker.claim(0).id for _ in range(3)] == [first_id, second_id, prefetch_id]
+    assert broker.claim(0) is None
+
+def test_prefetch_jobs_only_fill_half_the_queue(broker):
+    broker.submit(EVENT, PRIORITY_PREFETCH)
+    broker.submit(EVENT, PRIORITY_PREFETCH)
+    with pytest.raises(QueueFull) as e:
+        broker.submit(EVENT, PRIORITY_PREFETCH)
+    assert e.value.retry_after >= 1
+
+    # Interactive jobs still fit
+    broker.submit(EVENT, PRIORITY_INTERACTIVE)
+    broker.submit(EVENT, PRIORITY_INTERACTIVE)
+    with pytest.raises(QueueFull):
+        broker.submit(EVENT, PRIORITY_INTERACTIVE)
+    assert broker.depth() == 4
+
+def test_retry_after_follows_job_durations(broker, monkeypatch):
+    monkeypatch.setattr(broker, "average_duration", lambda: 2.3)
+    broker.max_queued = 0
+    with pytest.raises(QueueFull) as e:
+        broker.submit(EVENT)
+    assert e.value.retry_after == 3
+
+def test_wait_returns_and_forgets_finished_jobs(broker):
+    job_id = broker.submit(EVENT)
+    job = broker.claim(0)
+    assert job.event == EVENT
+    broker.complete(job.id, '{"flights": []}')
+    job = broker.wait(job_id, timeout=1)
+    assert job.status == "done"
+    assert job.result == '{"flights": []}'
+    assert broker.get(job_id) is None
+
+def test_wait_timeout_cancels_queued_jobs(broker):
+    job_id = broker.submit(EVENT)
+    with pytest.raises(TimeoutError):
+        broker.wait(job_id, timeout=0.1)
+    assert broker.get(job_id) is None
+    assert broker.depth() == 0
+    assert broker.claim(0) is None
+
+def test_wait_timeout_drops_the_result_of_running_jobs(broker):
+    job_id = broker.submit(EVENT)
+    broker.claim(0)
+    with pytest.raises(TimeoutError):
+        broker.wait(job_id, timeout=0.1)
+    broker.complete(job_id, '{"flights": []}')
+    assert broker.get(job_id) is None
+
+def test_sqlite_requeues_jobs_of_lost_workers(tmp_path):
+    broker = SQLiteBroker(str(tmp_path / "jobs.db"), lease=60)
+    job_id = broker.submit(EVENT)
+    assert broker.claim(0).id == job_id
+    assert broker.claim(0) is None
+
+    # The worker never finished the job within the lease
+    broker.lease = 0
+    assert broker.claim(0).id == job_id
+
+def test_incomplete_brokers_fail_on_instantiation():
+    class IncompleteBroker(Broker):
+        def submit(self, event, priority=PRIORITY_INTERACTIVE):
+            return 1
+
+    with pytest.raises(TypeError):
+        IncompleteBroker()
+
+class FakeBrowser():
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+@pytest.fixture
+def browsers(monkeypatch):
+    """
+    Replace browser launches with fake browsers, returning every browser launched.
+    """
+    launched = []
+
+    async def launch_browser(debug):
+        launched.append(FakeBrowser())
+        return launched[-1]
+
+    monkeypatch.setattr(scrape, "launch_browser", launch_browser)
+    return launched
+
+async def sleepy_scrape(event, browser_pool, scrape_latency):
+    """
+    Scrape job that holds a browser from the pool for a fixed time, like a real scrape.
+    """
+    browser = await browser_pool.acquire()
+    try:
+        await asyncio.sleep(scrape_latency)
+    finally:
+        browser_pool.release(browser)
+    return {"flights": [event]}
+
+def run_jobs(broker, jobs):
+    """
+    Submit jobs and wait for all of them, returning the finished jobs and the elapsed time.
+    """
+    start = time.perf_counter()
+    job_ids = [broker.submit(dict(EVENT, n=i)) for i in range(jobs)]
+    results = [broker.wait(job_id, timeout=30) for job_id in job_ids]
+    return results, time.perf_counter() - start
+
+def test_worker_threads_scale_with_workers(browsers):
+    jobs = 8
+    elapsed = {}
+    for workers in [1, 2, 4]:
+        broker = InProcessBroker(max_queued=jobs)
+        stop = threading.Event()
+        threads = start_worker_threads(broker, workers, 1, partial(sleepy_scrape, scrape_latency=0.2), stop)
+        try:
+            results, elapsed[workers] = run_jobs(broker, jobs)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        assert all(job.status == "done" for job in results)
+        assert sorted(json.loads(job.result)["flights"][0]["n"] for job in results) == list(range(jobs))
+
+    # Each worker launched one browser, reused it for all of its jobs and closed it when stopped
+    assert len(browsers) == 1 + 2 + 4
+    assert all(browser.closed for browser in browsers)
+
+    # N workers take about 1/N of the time of one worker
+    assert elapsed[1] >= jobs * 0.2
+    assert elapsed[2] < elapsed[1] / 2 * 1.5
+    assert elapsed[4] < elapsed[1] / 4 * 1.5
+
+def test_worker_processes_run_every_job(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    broker = SQLiteBroker(path, max_queued=8)
+    stop = multiprocessing.get_context("spawn").Event()
+    processes = start_worker_processes(path, 2, 1, partial(replay_scrape, scrape_latency=0.1), stop)
+    try:
+        results, _ = run_jobs(broker, 8)
+    finally:
+        stop.set()
+        for process in processes:
+            process.join()
+
+    assert all(job.status == "done" and json.loads(job.result)["flights"] for job in results)
+    assert all(process.exitcode == 0 for process in processes)
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(api, "initialize_workers", lambda: None)
+    return api.app.test_client()
+
+def test_full_queue_returns_429_with_retry_after(client, monkeypatch):
+    broker = InProcessBroker(max_queued=0)
+    monkeypatch.setattr(broker, "average_duration", lambda: 4.2)
+    monkeypatch.setattr(api, "broker", broker)
+    response = client.post('/', json=EVENT)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "5"
+
+def test_invalid_searches_return_400(client, monkeypatch):
+    monkeypatch.setattr(api, "broker", InProcessBroker())
+    assert client.post('/', json=dict(EVENT, origination="XXX")).status_code == 400
+    assert client.post('/', json=dict(EVENT, priority="urgent")).status_code == 400
@@ -0,0 +1,35 @@
+import json
+import pytest
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.exceptions import OutputParserException
+from langchain.agents.format_scratchpad import format_log_to_str
+from multi_action import MultiActionJSONAgentOutputParser
+
+def json_blob(actions):
+    return f"Action:\n```\n{json.dumps(actions)}\n```"
+
+def test_parse_multiple_actions():
+    text = json_blob([
+        {"action": "SearchSouthwestFlightsTool", "action_input": "a"},
+        {"action": "SearchSouthwestFlightsTool", "action_input": "b"},
+        {"action": "SearchSouthwestFlightsTool", "action_input": "c"},
+    ])
+    actions = MultiActionJSONAgentOutputParser().parse(text)
+    assert [action.tool_input for action in actions] == ["a", "b", "c"]
+
+    # The scratchpad shows the LLM output once, not once per action
+    scratchpad = format_log_to_str([(action, "observation") for action in actions])
+    assert scratchpad.count("SearchSouthwestFlightsTool") == 3
+    assert scratchpad.count("Action:") == 1
+
+def test_parse_final_answer_ends_the_turn():
+    text = json_blob([
+        {"action": "SearchSouthwestFlightsTool", "action_input": "a"},
+        {"action": "Final Answer", "action_input": "done"},
+    ])
+    assert MultiActionJSONAgentOutputParser().parse(text) == AgentFinish({"output": "done"}, text)
+
+@pytest.mark.parametrize("text", ["```[]```", json_blob([]), "not json"])
+def test_parse_invalid_output(text):
+    with pytest.raises(OutputParserException):
+        MultiActionJSONAgentOutputParser().parse(text)
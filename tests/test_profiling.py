@@ -0,0 +1,63 @@
+from uuid import uuid4
+import pytest
+from langchain_core.outputs import LLMResult
+from cache import PARSE_ERROR_TOOL
+from profiling import TurnProfiler, token_usage
+
+@pytest.mark.parametrize("llm_output,expected", [
+    # OpenAI
+    ({"token_usage": {"prompt_tokens": 120, "completion_tokens": 30, "total_tokens": 150}, "model_name": "gpt-4"}, (120, 30)),
+    # Bedrock
+    ({"usage": {"prompt_tokens": 80, "completion_tokens": 20, "total_tokens": 100}, "model_id": "anthropic.claude-v2"}, (80, 20)),
+    # Bedrock with the Anthropic messages API
+    ({"usage": {"input_tokens": 70, "output_tokens": 10}}, (70, 10)),
+    # Fake and streamed models don't report usage
+    ({}, (0, 0)),
+    (None, (0, 0)),
+])
+def test_token_usage(llm_output, expected):
+    assert token_usage(llm_output) == expected
+
+def call_llm(profiler, llm_output):
+    run_id = uuid4()
+    profiler.on_chat_model_start({}, [[]], run_id=run_id)
+    profiler.on_llm_end(LLMResult(generations=[], llm_output=llm_output), run_id=run_id)
+
+def call_tool(profiler, name, error=None):
+    run_id = uuid4()
+    profiler.on_tool_start({"name": name}, "{}", run_id=run_id)
+    if error is None:
+        profiler.on_tool_end("{}", run_id=run_id)
+    else:
+        profiler.on_tool_error(error, run_id=run_id)
+
+def test_turn_profile():
+    profiler = TurnProfiler("flights SAN to DAL")
+    call_llm(profiler, {"token_usage": {"prompt_tokens": 100, "completion_tokens": 10}})
+    call_tool(profiler, PARSE_ERROR_TOOL)
+    call_llm(profiler, {"usage": {"prompt_tokens": 150, "completion_tokens": 20}})
+    call_tool(profiler, "SearchSouthwestFlightsTool")
+    call_tool(profiler, "SearchSouthwestFlightsTool", error=RuntimeError("scrape failed"))
+    profiler.finish({"output": "answer", "intermediate_steps": []})
+
+    profile = profiler.to_dict()
+    assert profile["path"] == "agent"
+    assert profile["llm_call_count"] == 2
+    assert (profile["prompt_tokens"], profile["completion_tokens"]) == (250, 30)
+    # Parse error retries are counted, but aren't tool calls
+    assert profile["parse_errors"] == 1
+    assert profile["tool_call_count"] == 2
+    assert [call["error"] is not None for call in profile["tool_calls"]] == [False, True]
+    assert "1 parse error retries" in profiler.report()
+
+@pytest.mark.parametrize("response,path", [
+    ({"output": "answer", "fast_path": True}, "fast_path"),
+    ({"output": "answer", "cached": True}, "cached"),
+    ({"output": "answer"}, "agent"),
+    (None, "error"),
+])
+def test_turn_path(response, path):
+    profiler = TurnProfiler()
+    profiler.finish(response)
+    assert profiler.path == path
+    assert profiler.elapsed is not None
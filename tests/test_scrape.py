@@ -0,0 +1,140 @@
+import asyncio
+import logging
+from pathlib import Path
+import pytest
+import scrape
+from scrape import Flights, extract_html, initialize_parse_executor, parse_html_async, NEXT_PAGE_SELECTOR
+
+# A one-way results page with a single matrix of 17 flights
+PAGE = (Path(__file__).parent.parent / "debug.html").read_text()
+
+# A round trip results page, with the outbound flights in matrix 0 and the return flights in matrix 1
+ROUND_TRIP_PAGE = PAGE + PAGE.replace("air-search-results-matrix-0", "air-search-results-matrix-1")
+
+# The next page of results, which repeats every flight but one
+NEXT_PAGE = PAGE.replace("# 4783", "# 9999")
+
+def initialize_flights(return_date=None):
+    return Flights("2024-04-22", "SAN", "DAL", 1, 1, return_date=return_date)
+
+@pytest.fixture(params=["inline", "process"])
+def parse_executor(request, monkeypatch):
+    # Restore the module's executor after the test
+    monkeypatch.setattr(scrape, "_parse_executor", None)
+    monkeypatch.setattr(scrape, "_parse_executor_kind", None)
+    executor = initialize_parse_executor(request.param, 2)
+    yield request.param
+    if executor is not None:
+        executor.shutdown()
+
+def test_every_matrix_is_merged(parse_executor):
+    flights = initialize_flights()
+    asyncio.run(parse_html_async(flights, ROUND_TRIP_PAGE.replace("# 4783", "# 9999", 1)))
+    # Without a return date both matrices are outbound flights
+    assert len(flights.flights) == 18
+    assert flights.return_flights is None
+
+def test_round_trip_matrices_alternate_legs(parse_executor):
+    flights = initialize_flights(return_date="2024-04-25")
+    asyncio.run(parse_html_async(flights, ROUND_TRIP_PAGE))
+    assert len(flights.flights) == 17
+    assert len(flights.return_flights) == 17
+    assert {(flight.departure_date, flight.origination_airport) for flight in flights.flights} == {("2024-04-22", "SAN")}
+    assert {(flight.departure_date, flight.origination_airport) for flight in flights.return_flights} == {("2024-04-25", "DAL")}
+
+def test_duplicate_flights_across_pages_are_dropped(parse_executor):
+    flights = initialize_flights()
+    asyncio.run(parse_html_async(flights, [PAGE, NEXT_PAGE, PAGE]))
+    flight_numbers = [flight.flight_number for flight in flights.flights]
+    assert len(flight_numbers) == 18
+    assert flight_numbers[0] == "# 4783"
+    assert flight_numbers[-1] == "# 9999"
+
+def test_pages_without_results_are_an_error(parse_executor):
+    with pytest.raises(RuntimeError):
+        asyncio.run(parse_html_async(initialize_flights(), "<html><body>Access Denied</body></html>"))
+
+def test_round_trips_without_return_flights_are_logged(parse_executor, caplog):
+    flights = initialize_flights(return_date="2024-04-25")
+    with caplog.at_level(logging.WARNING, logger="scrape"):
+        asyncio.run(parse_html_async(flights, PAGE))
+    assert len(flights.flights) == 17
+    assert flights.return_flights is None
+    assert "No return flights" in caplog.text
+
+class FakeButton():
+    def __init__(self, page):
+        self.page = page
+
+    async def click(self):
+        self.page.index += 1
+
+class FakePage():
+    """
+    A browser page that shows the next page of results when its next page button is clicked.
+    """
+    def __init__(self, url, contents):
+        self.url = url
+        self.contents = contents
+        self.index = 0
+        self.selectors = []
+        self.closed = False
+
+    async def setViewport(self, viewport):
+        pass
+
+    async def goto(self, url, options):
+        pass
+
+    async def content(self):
+        return self.contents[self.index]
+
+    async def querySelector(self, selector):
+        self.selectors.append(selector)
+        if self.index + 1 < len(self.contents):
+            return FakeButton(self)
+        return None
+
+    async def waitForNavigation(self, options):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+class FakeBrowser():
+    def __init__(self, page):
+        self.page = page
+
+    async def newPage(self):
+        return self.page
+
+@pytest.fixture
+def fake_page(monkeypatch, tmp_path):
+    async def stealth(page):
+        pass
+
+    # extract_html writes debug.html to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scrape, "stealth", stealth)
+
+    def initialize_page(contents):
+        return FakePage("https://www.southwest.com/air/booking/select-depart.html", contents)
+
+    return initialize_page
+
+def test_pages_are_followed_until_there_is_no_next_page(fake_page):
+    page = fake_page(["page 1", "page 2", "page 3"])
+    pages = asyncio.run(extract_html(page.url, False, FakeBrowser(page)))
+    assert pages == ["page 1", "page 2", "page 3"]
+    assert set(page.selectors) == {NEXT_PAGE_SELECTOR}
+    # Only the page is closed, as the browser was passed in
+    assert page.closed
+
+def test_pages_stop_at_max_pages(fake_page, monkeypatch):
+    monkeypatch.setattr(scrape, "MAX_PAGES", 2)
+    page = fake_page(["page 1", "page 2", "page 3"])
+    assert asyncio.run(extract_html(page.url, False, FakeBrowser(page))) == ["page 1", "page 2"]
+
+def test_pages_stop_when_the_next_page_is_unchanged(fake_page):
+    page = fake_page(["page 1", "page 2", "page 2", "page 3"])
+    assert asyncio.run(extract_html(page.url, False, FakeBrowser(page))) == ["page 1", "page 2"]